@@ -0,0 +1,309 @@
+'''
+Micro-benchmarks of the path-finding, map generation and per-frame hot paths.
+
+Each benchmark runs over a grid of map sizes and densities (tile probability),
+on maps drawn from fixed seeds, so that runs are comparable across commits.
+Every case is timed with `timeit`: the number of calls is calibrated to take
+at least 0.2 s, and the best of `--repeat` rounds is kept (the least disturbed
+by other processes).
+
+Nothing here needs a display: it runs headless, e.g. on CI nodes.
+
+Usage:
+    python -m benchmarks.bench --output bench.json
+    python -m benchmarks.bench --save-baseline           # on the reference
+    python -m benchmarks.bench --baseline benchmarks/baseline.json
+
+When a baseline is given, the run is compared case by case against it, and
+the exit status is 1 if any case got slower by more than `--threshold` (as a
+fraction, e.g. 0.2 = 20%).
+
+The import time of `src.simulation` (what every headless worker pays at
+startup) is checked as well: the exit status is 1 if it exceeds
+`--import-budget`, or if it loads pygame or pandas.
+
+Results format ('.json'):
+    meta    : python, numpy and platform versions, date
+    results : {case: {'time': best seconds per call, 'number': calls per
+              round, 'repeat': rounds}}, cases named as
+              'benchmark[size=..,density=..]'
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from types import SimpleNamespace
+import numpy as np
+
+# src:
+from src.agents import Agents
+from src.astar import astar
+from src.flow_field import compute_flow_field
+from src.map_generators import create_traversable_map, write_map_to_file
+from src.reachability import label_components
+from src.utils import check_player_on_tile, coords_map_to_screen
+
+SIZES = (32, 128, 512)
+DENSITIES = (0.3, 0.6, 0.9)
+SEED = 0
+
+PATH_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+PATH_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# repository root, from which `src` is imported
+
+_tmp_dir = None
+# temporary folder of `bench_write_map_to_file`, for the whole run
+
+
+# Benchmarks ##################################################################
+# Each takes a map size and density, does its setup, and returns the function
+# to be timed.
+
+def _make_map(size, density):
+    return create_traversable_map(size, size, p_tile=density, rng=SEED)
+
+
+def bench_astar(size, density):
+    '''`astar` between the two farthest tiles (in index order) of the largest
+    island.'''
+    map_data = _make_map(size, density)
+    labels = label_components(map_data)
+    values, counts = np.unique(labels[labels >= 0], return_counts=True)
+    tiles = np.flatnonzero(labels == values[np.argmax(counts)])
+    y_start, x_start = divmod(int(tiles[0]), size)
+    y_goal, x_goal = divmod(int(tiles[-1]), size)
+
+    map_astar = 1 - map_data.T
+    # map's x and y get switched in numpy, hence the transpose
+
+    return lambda: astar(map_astar, (x_start, y_start), (x_goal, y_goal))
+
+
+def bench_create_traversable_map(size, density):
+    return lambda: create_traversable_map(size, size, p_tile=density,
+                                          rng=SEED)
+
+
+def bench_check_player_on_tile(size, density):
+    '''On-tile check of a player standing in the middle of the map.'''
+    map_data = _make_map(size, density)
+    world = SimpleNamespace(map_data=map_data, map_shape=map_data.shape)
+    player = SimpleNamespace(x_map=size / 2, y_map=size / 2, z_map=0)
+
+    return lambda: check_player_on_tile(player, world)
+
+
+def bench_coords_map_to_screen(size, density):
+    sprites_maps_meta = {'stride_dx': 16, 'stride_dy': 8}
+
+    return lambda: coords_map_to_screen(size / 2, size / 2, 150, 0,
+                                        sprites_maps_meta)
+
+
+def bench_write_map_to_file(size, density):
+    '''Writes a '.npz' map into a temporary folder (a new file every call).'''
+    map_data = _make_map(size, density)
+    path_to_basename = os.path.join(_tmp_dir.name, 'map_%d.npz' % size)
+
+    return lambda: write_map_to_file(map_data, path_to_basename, seed=SEED)
+
+
+def bench_agents_step(size, density, n_agents=10000):
+    '''`Agents.step` of a crowd of 10k agents heading to the same tile.'''
+    map_data = _make_map(size, density)
+    rng = np.random.default_rng(SEED)
+    world = SimpleNamespace(map_data=map_data, map_shape=map_data.shape,
+                            rng=rng)
+    labels = label_components(map_data)
+    values, counts = np.unique(labels[labels >= 0], return_counts=True)
+    tiles = np.flatnonzero(labels == values[np.argmax(counts)])
+    y_goal, x_goal = divmod(int(tiles[-1]), size)
+
+    flow_field = compute_flow_field(map_data, (x_goal, y_goal))
+    world.get_flow_field = lambda goal: flow_field
+    agents = Agents(world, n_agents)
+    agents.spawn_random()
+    agents.send_to((x_goal, y_goal))
+    # NOTE: Agents reaching the goal stay idle on it: the timing covers a
+    #       mix of moving and idle agents, as in a running game.
+
+    return agents.step
+
+
+BENCHMARKS = {
+    # name: (function, depends on size, depends on density)
+    'astar': (bench_astar, True, True),
+    'create_traversable_map': (bench_create_traversable_map, True, True),
+    'check_player_on_tile': (bench_check_player_on_tile, False, False),
+    'coords_map_to_screen': (bench_coords_map_to_screen, False, False),
+    'write_map_to_file': (bench_write_map_to_file, True, False),
+    'agents_step': (bench_agents_step, True, False),
+}
+
+
+# Import time #################################################################
+
+def check_import_time(module='src.simulation', repeat=5,
+                      forbidden=('pygame', 'pandas')):
+    '''Times the import of a module in fresh interpreters.
+
+    NumPy is imported beforehand and left out of the timing: it is a hard
+    dependency, whose import time does not depend on this repository.
+
+    Returns
+    -------
+    seconds : float
+        Best import time over `repeat` interpreters.
+    loaded : list
+        Modules of `forbidden` loaded by the import.
+    '''
+    code = ('import sys, time, numpy\n'
+            't = time.perf_counter()\n'
+            'import %s\n'
+            'print(time.perf_counter() - t)\n'
+            'print(",".join(m for m in %r if m in sys.modules))'
+            % (module, tuple(forbidden)))
+
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], cwd=PATH_ROOT,
+                                check=True, capture_output=True,
+                                text=True).stdout.split('\n')
+        times.append(float(output[0]))
+
+    return min(times), [name for name in output[1].split(',') if name]
+
+
+# Running and comparing #######################################################
+
+def get_cases(names=None, sizes=SIZES, densities=DENSITIES):
+    '''Yields the (case, benchmark, size, density) to run.
+
+    Parameters that a benchmark does not depend on are fixed to the middle
+    value of the grid.
+    '''
+    for name, (function, by_size, by_density) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        for size in (sizes if by_size else sizes[len(sizes)//2:][:1]):
+            for density in (densities if by_density
+                            else densities[len(densities)//2:][:1]):
+                case = '%s[size=%d,density=%g]' % (name, size, density)
+                yield case, function, size, density
+
+
+def run(names=None, sizes=SIZES, densities=DENSITIES, repeat=5):
+    '''Runs the benchmarks, printing each case as it is done.
+
+    Returns
+    -------
+    results : dict
+        See the module's docstring.
+    '''
+    global _tmp_dir
+    _tmp_dir = tempfile.TemporaryDirectory()
+
+    results = {}
+    try:
+        for case, function, size, density in get_cases(names, sizes,
+                                                       densities):
+            timer = timeit.Timer(function(size, density))
+            number, _ = timer.autorange()
+            best = min(timer.repeat(repeat=repeat, number=number)) / number
+            results[case] = {'time': best, 'number': number, 'repeat': repeat}
+            print('run:: %-50s %12.3f us' % (case, best * 1e6))
+    finally:
+        _tmp_dir.cleanup()
+
+    meta = {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+    return {'meta': meta, 'results': results}
+
+
+def compare(results, baseline, threshold=0.2):
+    '''Compares results to a baseline, printing the ratio of each case.
+
+    Returns
+    -------
+    regressions : list
+        Cases slower than the baseline by more than `threshold`.
+    '''
+    regressions = []
+    for case, result in results['results'].items():
+        if case not in baseline['results']:
+            print('compare:: %-50s (no baseline)' % case)
+            continue
+        ratio = result['time'] / baseline['results'][case]['time']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            regressions.append(case)
+        elif ratio < 1 - threshold:
+            flag = 'improvement'
+        print('compare:: %-50s x%6.2f %s' % (case, ratio, flag))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=None,
+                        help='path of the results file (.json)')
+    parser.add_argument('--baseline', default=None,
+                        help='results file to compare against')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results as %s' % PATH_BASELINE)
+    parser.add_argument('--threshold', type=float, default=0.2)
+    parser.add_argument('--only', nargs='+', default=None,
+                        choices=list(BENCHMARKS), metavar='BENCHMARK')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--densities', type=float, nargs='+',
+                        default=DENSITIES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--import-budget', type=float, default=0.05,
+                        help='seconds allowed to import src.simulation')
+    args = parser.parse_args()
+
+    results = run(args.only, args.sizes, args.densities, args.repeat)
+
+    failed = False
+    seconds, loaded = check_import_time(repeat=args.repeat)
+    results['results']['import[src.simulation]'] = \
+        {'time': seconds, 'number': 1, 'repeat': args.repeat}
+    print('run:: %-50s %12.3f us' % ('import[src.simulation]', seconds * 1e6))
+    if seconds > args.import_budget or loaded:
+        print('main:: import of src.simulation over budget (%.0f ms > %.0f '
+              'ms), or loading %s' % (seconds * 1e3, args.import_budget * 1e3,
+                                      loaded))
+        failed = True
+
+    for path, save in ((args.output, args.output is not None),
+                       (PATH_BASELINE, args.save_baseline)):
+        if save:
+            with open(path, 'w') as file:
+                json.dump(results, file, indent=4)
+            print('main:: results saved to %s' % path)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('main:: %d regression(s) over %d%%' %
+                  (len(regressions), args.threshold * 100))
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
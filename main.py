@@ -1,28 +1,37 @@
 import pygame
 from pygame.locals import * # keys
 
+import argparse
+import os
 import sys
+import time
 
 # src:
-import src.world as world
-from src.player import Player
+from src.simulation import Simulation
 from src.utils import coords_map_to_screen, coords_map_to_mini
-from src.utils import check_player_on_tile
 from src.commands_list import CommandsList
+from src.renderer import Camera, MapRenderer
+from src.profiler import FrameProfiler, ProfilerOverlay
+from src.timestep import FixedTimestep
+from src.recorder import Recorder, Replay
+from src.policy import BatchedPolicy, greedy_policy
+from src.map_generators import get_unique_filename
+from src.log import configure as configure_logging
 from src.set_end_point import set_end_point
 
 # The main game class that is intantiated on startup:
 # see https://github.com/lukasz1985/SREM/blob/master/main.py
 class Game:
 
-    def __init__(self, w=900, h=900):
+    def __init__(self, w=900, h=900, n_agents=0, record=None, replay=None,
+                 policy=None):
         # Initializing pygame modules:
         pygame.init()
 
         # Screen setup:
         self.screen = pygame.display.set_mode((w, h),0,32)
         pygame.display.set_caption("walker")
-        self.display = pygame.Surface((300, 300))
+        self.display = pygame.Surface((300, 300)).convert()
         self.offset_x = 150
         self.offset_y = 100
         # offset of layer not to overlap with minimap
@@ -30,22 +39,59 @@ class Game:
         # Create a CommandsList instance
         self.commands_list = CommandsList(self.screen)
         
-        # World creation:
-        self.world = world.World(self)
-        
+        # Simulation (world and player), rendered by this class:
+        self.sim = Simulation(spawn_x_map=0, spawn_y_map=0, target=(6, 13),
+                              method='AStar', headless=False,
+                              n_agents=n_agents,
+                              recorder=None if record is None
+                                       else Recorder(record),
+                              policy=policy)
+        # episodes recorded to the `record` folder, if given
+        self.replay = None if replay is None else Replay(replay)
+        # NOTE: When replaying an episode file, the simulation is never
+        #       stepped: its state is read from the file (see `Replay`).
+        self.world = self.sim.world
         # Player control object:
         #self.player_offset_x = self.world.map_unit_dx/2 - 14/2 # == half tile - half player
         #self.player_offset_y = -21 + 5 # == base of the player at a tile stride from top of tile
         # offset to align player with the center of the "surface" of a tile
-        self.player = Player(self, spawn_x_map=0, spawn_y_map=0)
+        self.player = self.sim.player
+
+        # Map renderer (chunks of tiles and minimap), and camera following
+        # the player:
+        self.box_dx_mini, self.box_dy_mini = 7, 7
+        # minimap box sizes (shrunk by the renderer for large maps)
+        # TODO: Move to external file
+        self.renderer = MapRenderer(self.world, box_dx_mini=self.box_dx_mini,
+                                    box_dy_mini=self.box_dy_mini)
+        self.camera = Camera(self.display.get_size(),
+                             self.offset_x, self.offset_y)
+        # NOTE: Maps that fit in the display stay at the offsets above.
+
+        # Frame profiler (off until toggled):
+        self.profiler = FrameProfiler(('events', 'update', 'draw', 'tick'))
+        self.profiler_overlay = ProfilerOverlay(self.screen, self.profiler)
+
+        # Fixed-timestep simulation, independent from the frame rate:
+        self.timestep = FixedTimestep()
+        self.fast_forward = False
+        # if True, steps run as fast as possible, and nothing is rendered
+        self.pending_events = []
+        # events not yet passed to a simulation step
+        self._fast_forward_steps, self._fast_forward_time = 0, 0.
+        # steps run and wall time, since the last fast-forward speed update
 
         # Utilities:
         self.done = False  # A flag for the game loop indicating if the game is done playing
         self.clock = pygame.time.Clock() # Clock to control the framerate
+        self.frame_time = 0.
+        # wall time of the last frame, in seconds
 
     def loop(self):
         while not self.done:
 
+            self.profiler.start_frame()
+
             self.events = pygame.event.get()
             for event in self.events:
                 if event.type == pygame.QUIT:
@@ -54,6 +100,7 @@ class Game:
                 if event.type == KEYDOWN:
                     # Request quit                                        
                     if event.key == K_ESCAPE:
+                        self.close()
                         pygame.quit()
                         sys.exit()
                     # Capture end point
@@ -61,106 +108,180 @@ class Game:
                         print("Waiting for mouse click...")
                         end_x, end_y = set_end_point(self.screen)
                         print(f"Endpoint set to: ({end_x}, {end_y})")
+                    # Player (and crowd, unless driven by a policy) heads to
+                    # the target
+                    elif event.key == K_RETURN and self.replay is None:
+                        self.sim.start_moving()
                     # Display commands list
                     elif event.key == pygame.K_TAB:
                         self.commands_list.toggle_visibility()
+                    # Frame profiler
+                    elif event.key == pygame.K_p:
+                        self.profiler.toggle()
+                    elif event.key == pygame.K_o:
+                        self.dump_profile()
+                    # Simulation speed
+                    elif event.key == pygame.K_f:
+                        self.fast_forward = not self.fast_forward
+                        self.update_caption()
+                    elif event.key == pygame.K_RIGHTBRACKET:
+                        self.timestep.scale(2)
+                        self.update_caption()
+                    elif event.key == pygame.K_LEFTBRACKET:
+                        self.timestep.scale(0.5)
+                        self.update_caption()
+
+            self.profiler.lap('events')
             
             # LOGICAL UPDATES #################################################
 
-            self.update()
+            if self.fast_forward:
+                self.update(budget=1/60)
+                # events are still handled at ~60 Hz
+            else:
+                self.update(self.timestep.advance(self.frame_time))
+            self.profiler.lap('update')
 
             ###################################################################
 
             # RENDER GRAPHICS #################################################
 
-            self.draw()
+            if not self.fast_forward:
+                self.draw()
+            self.profiler.lap('draw')
             
             ###################################################################
 
-            #self.update(self.clock)
-            self.clock.tick(60)
-
-    def update(self):
+            self.frame_time = \
+                self.clock.tick(0 if self.fast_forward else 60) / 1000
+            # NOTE: The frame rate is only capped when rendering.
+            self.profiler.lap('tick')
+            # time left waiting for the next frame
+            self.profiler.end_frame()
+
+        self.close()
+
+    def close(self):
+        '''Closes the episode being recorded, and the policy's worker thread,
+        if any.'''
+        if self.sim.recorder is not None:
+            self.sim.recorder.close()
+        if self.sim.policy is not None:
+            self.sim.policy.close()
+
+    def dump_profile(self):
+        '''Writes the profiled frames to a CSV file in the tmp folder.'''
+        path_profiles = self.world.path_tmp + '/profiles'
+        if not os.path.exists(path_profiles): os.makedirs(path_profiles)
+
+        path_to_csv = get_unique_filename(path_profiles + '/profile.csv')
+        self.profiler.dump_csv(path_to_csv)
+        print('dump_profile:: %d frames written to %s' %
+              (min(self.profiler.n_frames, self.profiler.capacity),
+               path_to_csv))
+
+    def update_caption(self):
+        '''Shows the simulation speed in the window's title.'''
+        if self.fast_forward:
+            caption = 'walker [fast-forward]'
+        elif self.timestep.time_scale != 1:
+            caption = 'walker [%gx]' % self.timestep.time_scale
+        else:
+            caption = 'walker'
+        pygame.display.set_caption(caption)
+
+    def update(self, n_steps=1, budget=None):
+        '''Runs `n_steps` simulation steps, or, if `budget` is given, as many
+        steps as fit in `budget` seconds of wall time.'''
 
         keys = pygame.key.get_pressed()
 
         # Check if a new map shall be generated:
-        if keys[pygame.K_m]:
+        if keys[pygame.K_m] and self.replay is None:
             self.world.generate_map(15, 15, type='traversable')
             # Add a small delay to prevent multiple press detections:
             pygame.time.delay(100)
             # delay in milliseconds
 
-        # Moving player:
-        self.player.move(keys)
-
         # TODO: Use key parser rather than allow decisions inside methods
 
-        # Checking if the player has to be moved through waypoints:
-        if check_player_on_tile(self.player, self.world):
-        # skipping if player is free falling
-            waypoints = self.player.find_path(6, 13,
-                            map_data=self.world.map_data, method='AStar')
-            self.player.move_through(self.events, waypoints)
-
-        # Checking if the player is currently over a hole:
-        self.player.on_tile = check_player_on_tile(self.player, self.world)
-        self.player.drop(self.player.on_tile)
+        # Moving player, path following and physics:
+        self.pending_events += self.events
+        time_start = time.perf_counter()
+        step = 0
+        while (step < n_steps if budget is None
+               else time.perf_counter() - time_start < budget):
+            if self.replay is not None:
+                self.replay.step(self.sim)
+            else:
+                self.sim.step(events=self.pending_events, keys=keys)
+            self.pending_events = []
+            # NOTE: Events go to the first step only (if any in this frame).
+            step += 1
+
+        if budget is not None:
+            # Measured speed, in the window's title every second:
+            self._fast_forward_steps += step
+            self._fast_forward_time += time.perf_counter() - time_start
+            if self._fast_forward_time >= 1:
+                pygame.display.set_caption('walker [fast-forward: %.0fx]' % (
+                    self._fast_forward_steps * self.timestep.dt /
+                    self._fast_forward_time))
+                self._fast_forward_steps, self._fast_forward_time = 0, 0.
 
     def draw(self):
-        self.display.fill((35,35,35))
-
-        box_dx_mini, box_dy_mini = 7, 7
-        # minimap box sizes
-        # TODO: Move to external file
+        # Player's position, interpolated between the last two steps:
+        x_map, y_map, _ = self.sim.interpolate(self.timestep.alpha)
+
+        # Camera, centered on the surface of the player's tile:
+        meta = self.world.sprites_maps_meta['grass']
+        x_player, y_player = coords_map_to_screen(x_map, y_map, 0, 0, meta)
+        self.camera.follow(x_player + self.world.map_unit_dx/2,
+                           y_player + meta['stride_dy'],
+                           self.renderer.get_bounds())
+        offset_x, offset_y = self.camera.get_offset()
+
+        # Map, only the chunks in view:
+        self.renderer.draw(self.display, self.camera)
+
+        # Crowd of agents, in a single batch:
+        if self.sim.agents is not None:
+            self.renderer.draw_agents(self.display, self.camera,
+                *self.sim.agents.interpolate(self.timestep.alpha),
+                self.player.sprites['player_0'])
+
+        # Player --------------------------------------------------------------
+        player_x, player_y = coords_map_to_screen(\
+                x_map, y_map,\
+                offset_x, offset_y,\
+                meta, type='player',\
+                world=self.world, player=self.player)
+
+        self.display.blit(self.player.sprites['player_0'], (player_x, player_y))
+
+        # Minimap, with the player's location:
+        self.display.blit(self.renderer.get_minimap(), (0, 0))
+
+        player_x_mini, player_y_mini = coords_map_to_mini(\
+            x_map, y_map,\
+            self.renderer.box_dx_mini, self.renderer.box_dy_mini)
+        
+        pygame.draw.circle(self.display, 'red',\
+                            (player_x_mini, player_y_mini), 3, 1)
+        #----------------------------------------------------------------------
 
-        for y_map, x_map in self.world.coordinates:
-
-            if self.world.map_data[y_map][x_map]:
-            # there is a "1" in the map
-
-                # Minimap -----------------------------------------------------
-                pygame.draw.rect(self.display, (255, 255, 255),\
-                    pygame.Rect(x_map*box_dx_mini, y_map*box_dy_mini,\
-                                box_dx_mini, box_dy_mini), 1)
-                # displaying minimap boxes
-                #--------------------------------------------------------------
-
-                # Map ---------------------------------------------------------
-                x_tile, y_tile = coords_map_to_screen(x_map, y_map,\
-                    self.offset_x, self.offset_y, self.world.sprites_maps_meta['grass'])
-                
-                self.display.blit(self.world.sprites_maps['grass'],\
-                                    (x_tile, y_tile))
-                # debug : Show rectangle around each tile:
-                #pygame.draw.rect(self.display, (255, 255, 255),\
-                #    pygame.Rect(x_tile, y_tile, 20, 24), 1)
-                #--------------------------------------------------------------
-
-            # Player ----------------------------------------------------------
-            player_x, player_y = coords_map_to_screen(\
-                    self.player.x_map, self.player.y_map,\
-                    self.offset_x, self.offset_y,\
-                    self.world.sprites_maps_meta['grass'], type='player',\
-                    world=self.world, player=self.player)
-
-            # Displaying player location on minimap:
-            player_x_mini, player_y_mini = coords_map_to_mini(\
-                self.player.x_map, self.player.y_map, box_dx_mini, box_dy_mini)
-            
-            pygame.draw.circle(self.display, 'red',\
-                                (player_x_mini, player_y_mini), 3, 1)
-            
-            self.display.blit(self.player.sprites['player_0'], (player_x, player_y))
-            #------------------------------------------------------------------
-                
-        self.screen.blit(pygame.transform.scale(self.display, self.screen.get_size()), (0, 0))
+        pygame.transform.scale(self.display, self.screen.get_size(), self.screen)
+        # NOTE: Scaling straight into the screen, rather than allocating a new
+        #       scaled surface every frame.
         
         # Commands List side panel --------------------------------------------
         # Draw overlay if visible (as regulated by `toggle_visibility`).
         '''IMPORTANT: The command list is created on the screen, so invoke
             this only after the screen is blitted.'''
         self.commands_list.draw()
+
+        # Frame profiler, next to the commands list (if enabled):
+        self.profiler_overlay.draw()
         #----------------------------------------------------------------------
         
         #pygame.display.update()
@@ -169,7 +290,26 @@ class Game:
 
 
 def start():
-    game = Game()
+    parser = argparse.ArgumentParser(description='walker')
+    parser.add_argument('--agents', type=int, default=0,
+                        help='size of a crowd of agents walking along')
+    parser.add_argument('--record', default=None, metavar='FOLDER',
+                        help='record every episode to FOLDER')
+    parser.add_argument('--replay', default=None, metavar='EPISODE',
+                        help='replay a recorded episode file')
+    parser.add_argument('--greedy', action='store_true',
+                        help='drive the agents with the reference batched '
+                             'policy (see src/policy.py)')
+    args = parser.parse_args()
+
+    configure_logging()
+    # levels from the WALKER_LOG environment variable, if set
+    policy = None
+    if args.greedy:
+        policy = BatchedPolicy(greedy_policy, threaded=True)
+        # inferring while the frame is rendered
+    game = Game(n_agents=args.agents, record=args.record, replay=args.replay,
+                policy=policy)
     game.loop()
 
 
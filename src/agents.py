@@ -0,0 +1,278 @@
+'''
+Crowds of agents, stored as a struct of arrays.
+
+Positions, statuses and path cursors of all the agents are kept in contiguous
+NumPy arrays, and the per-agent methods of `Player` (`move_action`, `drop`,
+`move_to`, `move_through`) and `check_player_on_tile` have vectorized
+counterparts here, applied to all the agents at once. Paths are stored back to
+back in a single waypoints array, each agent holding a cursor to its current
+waypoint and the end of its path:
+
+    agents = Agents(world, 10000)
+    agents.spawn_random()
+    agents.send_to((6, 13))
+    for _ in range(1000):
+        agents.step()
+'''
+import numpy as np
+
+# src:
+from src.player import ACTIONS
+from src.utils import check_on_tile_batch
+
+# Statuses, as stored in `Agents.status` (see `Player.status`):
+STATUSES = ('idle', 'moving_through')
+IDLE, MOVING_THROUGH = 0, 1
+
+
+class Agents:
+    '''
+    Agents on the map of a world, updated in lockstep.
+
+    Parameters
+    ----------
+    world : World
+        World whose map the agents walk on.
+    n_agents : int
+        Number of agents, all spawned at (0, 0) (see `spawn_random`).
+    '''
+    def __init__(self, world, n_agents):
+        self.world = world
+        self.n_agents = n_agents
+
+        self.actions = np.array(ACTIONS, dtype=np.float64)
+        # displacement of each action, indexed by action
+
+        # State of each agent:
+        self.x_map = np.zeros(n_agents)
+        self.y_map = np.zeros(n_agents)
+        self.z_map = np.zeros(n_agents)
+        self.status = np.full(n_agents, IDLE, dtype=np.int8)
+        # index in `STATUSES`
+        self.on_tile = np.ones(n_agents, dtype=bool)
+
+        self.x_previous = np.zeros(n_agents)
+        self.y_previous = np.zeros(n_agents)
+        # positions before the last step, for interpolation
+
+        # Paths:
+        self.waypoints = np.zeros((0, 2))
+        # waypoints of all the paths, back to back, as [x_map, y_map]
+        self.cursor = np.zeros(n_agents, dtype=np.int64)
+        self.path_end = np.zeros(n_agents, dtype=np.int64)
+        # index of the current waypoint of each agent, and end of its path
+
+    def spawn(self, x_map, y_map, agents=None):
+        '''Places agents (all of them, by default) at the given positions,
+        idle.'''
+        if agents is None: agents = np.arange(self.n_agents)
+
+        self.x_map[agents] = self.x_previous[agents] = x_map
+        self.y_map[agents] = self.y_previous[agents] = y_map
+        self.z_map[agents] = 0
+        self.on_tile[agents] = True
+        self.status[agents] = IDLE
+        self.cursor[agents] = self.path_end[agents] = 0
+
+    def spawn_random(self, rng=None):
+        '''Places every agent on a random tile of the map (the world's random
+        generator is used by default).'''
+        if rng is None: rng = self.world.rng
+
+        tiles = np.flatnonzero(np.asarray(self.world.map_data))
+        y_map, x_map = np.divmod(rng.choice(tiles, size=self.n_agents),
+                                 self.world.map_shape[1])
+        self.spawn(x_map.astype(np.float64), y_map.astype(np.float64))
+
+    # Paths -------------------------------------------------------------------
+
+    def set_paths(self, agents, waypoints, lengths):
+        '''Sets the paths of some agents, which start moving through them.
+
+        Parameters
+        ----------
+        agents : array-like, shape (n,), dtype: int
+            Agents whose paths are set.
+        waypoints : array-like, shape (sum(lengths), 2)
+            Waypoints of all the paths, back to back, as [x_map, y_map].
+        lengths : array-like, shape (n,), dtype: int
+            Number of waypoints of each path (agents with an empty path are
+            set idle).
+        '''
+        agents = np.asarray(agents, dtype=np.int64)
+        lengths = np.asarray(lengths, dtype=np.int64)
+
+        self.cursor[agents] = self.path_end[agents] = 0
+        # dropping the agents' previous paths, before compacting
+        self._compact()
+
+        offsets = len(self.waypoints) + np.cumsum(lengths) - lengths
+        self.waypoints = np.concatenate(
+            (self.waypoints, np.asarray(waypoints, dtype=np.float64)
+                                 .reshape(-1, 2)))
+        self.cursor[agents] = offsets
+        self.path_end[agents] = offsets + lengths
+        self.status[agents] = np.where(lengths > 0, MOVING_THROUGH, IDLE)
+
+    def _compact(self):
+        '''Drops the waypoints already passed, keeping the remaining ones back
+        to back.'''
+        remaining = self.path_end - self.cursor
+        offsets = np.cumsum(remaining) - remaining
+        index = np.arange(remaining.sum()) + \
+            np.repeat(self.cursor - offsets, remaining)
+
+        self.waypoints = self.waypoints[index]
+        self.cursor = offsets
+        self.path_end = offsets + remaining
+
+    def send_to(self, goal, agents=None):
+        '''Sends agents (all of them, by default) to a goal tile (x_map,
+        y_map), along the world's flow field towards it.
+
+        All the paths are followed at once, one step per round: the number of
+        rounds is the length of the longest path. Agents that cannot reach the
+        goal are set idle.
+
+        Returns
+        -------
+        reachable : np.ndarray, shape (n,), dtype: bool
+            Whether each agent can reach the goal.
+        '''
+        if agents is None: agents = np.arange(self.n_agents)
+        agents = np.asarray(agents, dtype=np.int64)
+        flow_field = self.world.get_flow_field(goal)
+        # shared with any other agent heading to the same goal
+
+        x_map = self.x_map[agents].astype(np.int64)
+        y_map = self.y_map[agents].astype(np.int64)
+        # NOTE: Truncated, as the start in `Player.find_path`.
+        height, width = self.world.map_shape
+        inside = (0 <= x_map) & (x_map < width) & (0 <= y_map) & (y_map < height)
+        x_map, y_map = x_map.clip(0, width - 1), y_map.clip(0, height - 1)
+
+        reachable = inside & ((flow_field.direction[y_map, x_map] >= 0) |
+                              ((x_map == goal[0]) & (y_map == goal[1])))
+
+        # Following the field, until every agent is at the goal:
+        steps, moving = [], []
+        active = reachable & (flow_field.direction[y_map, x_map] >= 0)
+        while active.any():
+            x_map, y_map = (flow_field.next_x[y_map, x_map],
+                            flow_field.next_y[y_map, x_map])
+            steps.append(np.stack((x_map, y_map), axis=1))
+            moving.append(active)
+            active = active & (flow_field.direction[y_map, x_map] >= 0)
+
+        if steps:
+            steps, moving = np.stack(steps, axis=1), np.stack(moving, axis=1)
+            # (n, rounds, 2) and (n, rounds), in agent-major order
+            self.set_paths(agents, steps[moving], moving.sum(axis=1))
+        else:
+            self.set_paths(agents, np.zeros((0, 2)),
+                           np.zeros(len(agents), dtype=np.int64))
+
+        return reachable
+
+    # Physics -----------------------------------------------------------------
+
+    def move(self, actions, speed=0.1):
+        '''Moves every agent by one step along one of the `ACTIONS` (see
+        `Player.move_action`).'''
+        displacement = self.actions[np.asarray(actions)] * speed
+        self.x_map += displacement[:, 0]
+        self.y_map += displacement[:, 1]
+
+    def drop(self, on_tile, speed=0.5):
+        '''Moves the agents off a tile along their fall (see `Player.drop`).'''
+        self.x_map[~on_tile] += speed
+        self.y_map[~on_tile] += speed
+
+    def move_to(self, x_target_map, y_target_map, speed=0.5, agents=None):
+        '''Moves agents (all of them, by default) towards their targets,
+        along straight paths (see `Player.move_to`).
+
+        Returns
+        -------
+        reached : np.ndarray, dtype: bool
+            Whether each agent reached its target, on which it is then
+            centered exactly.
+        '''
+        if agents is None: agents = np.arange(self.n_agents)
+
+        dx = x_target_map - self.x_map[agents]
+        dy = y_target_map - self.y_map[agents]
+        d = np.hypot(dx, dy)
+        # distance from current waypoint
+
+        reached = d <= speed
+        step = speed / np.where(reached, 1., d)
+        # NOTE: `speed / d` is the cosine and sine of the direction, times the
+        #       speed, over dx and dy.
+        self.x_map[agents] = np.where(reached, x_target_map,
+                                      self.x_map[agents] + dx * step)
+        self.y_map[agents] = np.where(reached, y_target_map,
+                                      self.y_map[agents] + dy * step)
+
+        return reached
+
+    def move_through(self, on_tile, speed=0.1):
+        '''Moves the agents on a tile through their paths (see
+        `Player.move_through`): reached waypoints are passed, and agents at
+        the end of their path are set idle.'''
+        agents = np.flatnonzero((self.status == MOVING_THROUGH) & on_tile)
+        if len(agents) == 0:
+            return
+
+        targets = self.waypoints[self.cursor[agents]]
+        reached = self.move_to(targets[:, 0], targets[:, 1], speed=speed,
+                               agents=agents)
+
+        agents = agents[reached]
+        self.cursor[agents] += 1
+        self.status[agents[self.cursor[agents] == self.path_end[agents]]] = \
+            IDLE
+
+    def check_on_tile(self):
+        '''Checks if each agent is on a tile, setting the others to free-fall
+        (see `check_player_on_tile`).'''
+        on_tile = check_on_tile_batch(self.x_map, self.y_map,
+                                      self.world.map_data, z_map=self.z_map)
+        self.z_map[~on_tile] = -999
+        # setting agents to free-fall
+
+        return on_tile
+
+    def step(self, actions=None):
+        '''Advances all the agents by one step, as `Simulation.step` does for
+        the player.
+
+        Parameters
+        ----------
+        actions : array-like, shape (n_agents,), dtype: int, optional
+            Index of a movement in `player.ACTIONS`, for each agent. If None,
+            the agents are not moved.
+
+        Returns
+        -------
+        on_tile : np.ndarray, shape (n_agents,), dtype: bool
+        '''
+        self.x_previous[:] = self.x_map
+        self.y_previous[:] = self.y_map
+
+        if actions is not None:
+            self.move(actions)
+
+        self.move_through(self.check_on_tile())
+        # agents free falling are skipped
+
+        self.on_tile = self.check_on_tile()
+        self.drop(self.on_tile)
+
+        return self.on_tile
+
+    def interpolate(self, alpha):
+        '''Returns the agents' positions (x_map, y_map) at a fraction `alpha`
+        of the last step (see `Simulation.interpolate`).'''
+        return (self.x_previous + alpha * (self.x_map - self.x_previous),
+                self.y_previous + alpha * (self.y_map - self.y_previous))
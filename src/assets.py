@@ -0,0 +1,199 @@
+'''
+Sprite atlas: all the sprites of 'data/images/sprites' packed into a single
+image, plus a manifest with the rectangle and the meta info of each sprite.
+
+The packed atlas is cached on disk ('data/tmp/assets'), and rebuilt only when
+a source file is added, removed or modified (the cache is keyed by the sources'
+paths, sizes and modification times). At startup, a single image is decoded
+and converted, and sprites are handed out as subsurfaces of it, which share
+its pixels and its colorkey.
+
+Sprites are named after their path, without extension, relative to the sprites
+folder (e.g. 'maps/grass', 'player/player_0').
+'''
+import pygame
+
+import glob
+import json
+import os
+
+# src:
+from src.utils import read_meta_csv
+
+PATH_SPRITES = 'data/images/sprites'
+PATH_CACHE = 'data/tmp/assets'
+ATLAS_VERSION = 1
+# bumped when the atlas format changes, to invalidate old caches
+
+
+def _source_files(path_sprites):
+    '''Returns the sorted paths of the sprites and of their meta files.'''
+    return sorted(glob.glob(path_sprites + '/**/*.png', recursive=True) +
+                  glob.glob(path_sprites + '/**/*.meta.csv', recursive=True))
+
+
+def get_cache_key(path_sprites):
+    '''Returns the key of the current sources: their relative paths, sizes and
+    modification times.'''
+    key = {'version': ATLAS_VERSION}
+    for path in _source_files(path_sprites):
+        stat = os.stat(path)
+        key[os.path.relpath(path, path_sprites)] = [stat.st_size,
+                                                    stat.st_mtime_ns]
+
+    return key
+
+
+def pack_rects(sizes, max_width=1024, padding=1):
+    '''Packs rectangles in rows ("shelves"), tallest first.
+
+    Parameters
+    ----------
+    sizes : list of tuple
+        (width, height) of each rectangle.
+    max_width : int, optional (default: 1024)
+        Width after which a new row is started (widened to the widest
+        rectangle, if needed).
+    padding : int, optional (default: 1)
+        Empty pixels between rectangles.
+
+    Returns
+    -------
+    positions : list of tuple
+        (x, y) of each rectangle, in the order of `sizes`.
+    size : tuple
+        (width, height) of the packed area.
+    '''
+    max_width = max([max_width] + [width for width, _ in sizes])
+
+    positions = [None] * len(sizes)
+    x = y = row_height = width_packed = 0
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i][1]):
+        width, height = sizes[i]
+        if x > 0 and x + width > max_width:
+            # New row:
+            x, y = 0, y + row_height + padding
+            row_height = 0
+        positions[i] = (x, y)
+        x += width + padding
+        row_height = max(row_height, height)
+        width_packed = max(width_packed, x - padding)
+
+    return positions, (width_packed, y + row_height)
+
+
+def build_atlas(path_sprites=PATH_SPRITES, path_cache=PATH_CACHE):
+    '''Packs the sprites into an atlas image, and writes it to the cache with
+    its manifest.
+
+    Returns
+    -------
+    atlas : pygame.Surface
+        Packed sprites, on a black background (the sprites' colorkey).
+    manifest : dict
+        'key' (see `get_cache_key`), 'rects' ({name: [x, y, width,
+        height]}) and 'meta' ({name: meta info}, for sprites with a meta
+        file).
+    '''
+    key = get_cache_key(path_sprites)
+
+    names, images, meta = [], [], {}
+    for path in _source_files(path_sprites):
+        name = os.path.relpath(path, path_sprites).replace(os.sep, '/')
+        if name.endswith('.meta.csv'):
+            meta[name[:-len('.meta.csv')]] = read_meta_csv(path)[0]
+        else:
+            names.append(name[:-len('.png')])
+            images.append(pygame.image.load(path))
+
+    positions, size = pack_rects([image.get_size() for image in images])
+
+    atlas = pygame.Surface(size)
+    atlas.fill((0, 0, 0))
+    for image, position in zip(images, positions):
+        atlas.blit(image, position)
+
+    manifest = {'key': key, 'meta': meta,
+                'rects': {name: [*position, *image.get_size()]
+                          for name, image, position
+                          in zip(names, images, positions)}}
+
+    # Cache:
+    if not os.path.exists(path_cache): os.makedirs(path_cache)
+    pygame.image.save(atlas, os.path.join(path_cache, 'atlas.png'))
+    with open(os.path.join(path_cache, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file, indent=4)
+    # NOTE: The manifest is written last, so that an interrupted build is
+    #       never taken for a valid cache.
+
+    return atlas, manifest
+
+
+class SpriteAtlas:
+    '''
+    All the sprites, as subsurfaces of a single converted atlas image.
+
+    The atlas is loaded from the cache when its key matches the sources, and
+    rebuilt otherwise (see `build_atlas`). A display mode has to be set first,
+    for the atlas to be converted to the display's pixel format.
+
+    Parameters
+    ----------
+    path_sprites : str, optional (default: 'data/images/sprites')
+        Folder of the source sprites (PNG) and meta files.
+    path_cache : str, optional (default: 'data/tmp/assets')
+        Folder of the cached atlas and manifest.
+    colorkey : tuple, optional (default: (0, 0, 0))
+        Transparent color of the sprites.
+    '''
+    def __init__(self, path_sprites=PATH_SPRITES, path_cache=PATH_CACHE,
+                 colorkey=(0, 0, 0)):
+        path_manifest = os.path.join(path_cache, 'manifest.json')
+
+        manifest = None
+        if os.path.exists(path_manifest):
+            with open(path_manifest) as file:
+                manifest = json.load(file)
+
+        if manifest is not None and \
+                manifest['key'] == get_cache_key(path_sprites):
+            atlas = pygame.image.load(os.path.join(path_cache, 'atlas.png'))
+        else:
+            atlas, manifest = build_atlas(path_sprites, path_cache)
+
+        self.surface = atlas.convert()
+        self.surface.set_colorkey(colorkey)
+        # inherited by the subsurfaces
+        self.rects = manifest['rects']
+        self.meta = manifest['meta']
+
+        self.sprites = {name: self.surface.subsurface(rect)
+                        for name, rect in self.rects.items()}
+
+    def get_group(self, folder):
+        '''Returns {sprite name within the folder: sprite} for the sprites of
+        a folder (e.g. 'maps').'''
+        prefix = folder.rstrip('/') + '/'
+        return {name[len(prefix):]: sprite
+                for name, sprite in self.sprites.items()
+                if name.startswith(prefix)}
+
+    def get_group_meta(self, folder):
+        '''Returns {sprite name within the folder: meta info} for the sprites
+        of a folder that have a meta file.'''
+        prefix = folder.rstrip('/') + '/'
+        return {name[len(prefix):]: meta
+                for name, meta in self.meta.items()
+                if name.startswith(prefix)}
+
+
+_atlases = {}
+# atlases loaded in this process, by sprites folder
+
+
+def get_atlas(path_sprites=PATH_SPRITES):
+    '''Returns the atlas of a sprites folder, loading it once per process.'''
+    if path_sprites not in _atlases:
+        _atlases[path_sprites] = SpriteAtlas(path_sprites)
+
+    return _atlases[path_sprites]
@@ -1,99 +1,144 @@
-class Node():
-    """A node class for A* Pathfinding"""
-
-    def __init__(self, parent=None, position=None):
-        self.parent = parent
-        self.position = position
-
-        self.g = 0
-        self.h = 0
-        self.f = 0
-
-    def __eq__(self, other):
-        return self.position == other.position
-
-
-def astar(maze, start, end):
-    """Returns a list of tuples as a path from the given start to the given end in the given maze"""
-
-    # Create start and end node
-    start_node = Node(None, start)
-    start_node.g = start_node.h = start_node.f = 0
-    end_node = Node(None, end)
-    end_node.g = end_node.h = end_node.f = 0
-
-    # Initialize both open and closed list
-    open_list = []
-    closed_list = []
-
-    # Add the start node
-    open_list.append(start_node)
+import heapq
+import time
+import numpy as np
+
+# Adjacent squares, as (d_row, d_col, step cost):
+SQRT2 = 2 ** 0.5
+NEIGHBORS = [(0, -1, 1.), (0, 1, 1.), (-1, 0, 1.), (1, 0, 1.),
+             (-1, -1, SQRT2), (-1, 1, SQRT2), (1, -1, SQRT2), (1, 1, SQRT2)]
+
+
+def octile(a, b):
+    '''Octile distance between two grid positions.
+
+    It is the exact cost of the shortest 8-connected path on an empty grid,
+    when straight steps cost 1 and diagonal steps cost sqrt(2), hence it never
+    overestimates the cost to the goal (admissible heuristic).
+    '''
+    d0 = abs(a[0] - b[0])
+    d1 = abs(a[1] - b[1])
+    return max(d0, d1) + (SQRT2 - 1) * min(d0, d1)
+
+
+def astar(maze, start, end, stats=None):
+    '''Returns a list of tuples as a path from the given start to the given end
+    in the given maze.
+
+    The open set is a binary heap, while the g-scores, parents and closed set
+    are flat NumPy arrays indexed by tile, so that each tile is expanded at
+    most once. The maze is padded with a border of non-walkable tiles, so that
+    neighbors are reached through constant flat offsets, without range checks.
+
+    Parameters
+    ----------
+    maze : array-like, shape (n_rows, n_cols)
+        Binary maze, where 0 indicates walkable tiles.
+    start, end : tuple
+        (row, col) positions in the maze.
+    stats : dict, optional (default: None)
+        If given, filled with the number of 'expanded' tiles and the search
+        'time' in seconds.
+
+    Returns
+    -------
+    path : list of tuples, or None
+        Positions from `start` to `end` (both included), or None if the end is
+        not reachable.
+    '''
+    time_start = time.perf_counter()
+
+    maze = np.asarray(maze)
+    n_rows, n_cols = maze.shape
+    n_cols_pad = n_cols + 2
+    # padded row stride
+
+    walkable = np.zeros((n_rows + 2, n_cols_pad), dtype=np.uint8)
+    walkable[1:-1, 1:-1] = (maze == 0)
+    walkable = memoryview(walkable.ravel())
+    # NOTE: Memoryviews give fast scalar access to the underlying NumPy
+    #       buffers, which would otherwise box every element into a NumPy
+    #       scalar.
+
+    g_array = np.full((n_rows + 2) * n_cols_pad, np.inf)
+    parent_array = np.full((n_rows + 2) * n_cols_pad, -1, dtype=np.int64)
+    closed_array = np.zeros((n_rows + 2) * n_cols_pad, dtype=np.uint8)
+    g, parent, closed = \
+        memoryview(g_array), memoryview(parent_array), memoryview(closed_array)
+    # per-tile cost from start, parent tile and expanded flag
+
+    offsets = [(d_row * n_cols_pad + d_col, cost)
+               for d_row, d_col, cost in NEIGHBORS]
+    # flat offsets of the adjacent squares
+
+    row_end, col_end = int(end[0]), int(end[1])
+    i_start = (int(start[0]) + 1) * n_cols_pad + int(start[1]) + 1
+    i_end   = (row_end + 1) * n_cols_pad + col_end + 1
+
+    g[i_start] = 0.
+    h_start = octile(start, end)
+    open_heap = [(h_start, h_start, 0., i_start)]
+    # entries are (f, h, g, tile): ties on f are broken towards the goal, which
+    # avoids expanding whole plateaus of equal f on open maps. Stale entries
+    # are skipped when popped.
+
+    n_expanded = 0
+    path = None
 
     # Loop until you find the end
-    while len(open_list) > 0:
+    while open_heap:
 
-        # Get the current node
-        current_node = open_list[0]
-        current_index = 0
-        for index, item in enumerate(open_list):
-            if item.f < current_node.f:
-                current_node = item
-                current_index = index
-
-        # Pop current off open list, add to closed list
-        open_list.pop(current_index)
-        closed_list.append(current_node)
+        # Pop the tile with the lowest f
+        _, _, g_current, i_current = heapq.heappop(open_heap)
+        if closed[i_current]:
+            continue
+        closed[i_current] = 1
+        n_expanded += 1
 
         # Found the goal
-        if current_node == end_node:
+        if i_current == i_end:
             path = []
-            current = current_node
-            while current is not None:
-                path.append(current.position)
-                current = current.parent
-            return path[::-1] # Return reversed path
-
-        # Generate children
-        children = []
-        for new_position in [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1)]: # Adjacent squares
+            while i_current != -1:
+                row, col = divmod(i_current, n_cols_pad)
+                path.append((row - 1, col - 1))
+                i_current = parent[i_current]
+            path = path[::-1] # Reversed path
+            break
 
-            # Get node position
-            node_position = (current_node.position[0] + new_position[0], current_node.position[1] + new_position[1])
+        # Loop through children
+        for offset, cost in offsets:
+            i_child = i_current + offset
 
-            # Make sure within range
-            if node_position[0] > (len(maze) - 1) or node_position[0] < 0 or node_position[1] > (len(maze[len(maze)-1]) -1) or node_position[1] < 0:
+            # Make sure walkable terrain (the border never is), and not
+            # expanded already
+            if not walkable[i_child] or closed[i_child]:
                 continue
 
-            # Make sure walkable terrain
-            if maze[node_position[0]][node_position[1]] != 0:
+            # Keep only improvements over the best known cost
+            g_child = g_current + cost
+            if g_child >= g[i_child]:
                 continue
+            g[i_child] = g_child
+            parent[i_child] = i_current
 
-            # Create new node
-            new_node = Node(current_node, node_position)
-
-            # Append
-            children.append(new_node)
-
-        # Loop through children
-        for child in children:
-
-            # Child is on the closed list
-            for closed_child in closed_list:
-                if child == closed_child:
-                    continue
+            # Octile heuristic, inlined:
+            # NOTE: f is rounded below, so that sums of sqrt(2) steps which
+            #       are equal up to float noise tie as they should.
+            row, col = divmod(i_child, n_cols_pad)
+            d_row = abs(row - 1 - row_end)
+            d_col = abs(col - 1 - col_end)
+            if d_row > d_col:
+                h_child = d_row + (SQRT2 - 1) * d_col
+            else:
+                h_child = d_col + (SQRT2 - 1) * d_row
 
-            # Create the f, g, and h values
-            child.g = current_node.g + 1
-            child.h = ((child.position[0] - end_node.position[0]) ** 2) + ((child.position[1] - end_node.position[1]) ** 2)
-            child.f = child.g + child.h
+            heapq.heappush(open_heap,
+                           (round(g_child + h_child, 9), h_child, g_child, i_child))
 
-            # Child is already in the open list
-            for open_node in open_list:
-                if child == open_node and child.g > open_node.g:
-                    continue
+    if stats is not None:
+        stats['expanded'] = n_expanded
+        stats['time'] = time.perf_counter() - time_start
 
-            # Add the child to the open list
-            open_list.append(child)
+    return path
 
 
 def main():
@@ -123,4 +168,4 @@ def main():
     print(path)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
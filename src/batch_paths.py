@@ -0,0 +1,188 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# src:
+from src.astar import astar
+from src.reachability import label_components, is_reachable
+
+# Worker state, set once per process by `_init_worker`:
+_shared = {}
+
+
+def _init_worker(shm_name, shapes, map_offsets):
+    '''Attaches a worker process to the shared block holding all the maps.'''
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _shared['shm'] = shm
+    # NOTE: The handle is kept alive for the whole life of the worker, since
+    #       the maps are views on its buffer.
+    _shared['buffer'] = np.ndarray((map_offsets[-1],), dtype=np.uint8,
+                                   buffer=shm.buf)
+    _shared['shapes'] = shapes
+    _shared['map_offsets'] = map_offsets
+    _shared['map_index'] = None
+    # index of the map currently converted for `astar`, and labeled
+
+
+def _get_map(map_index):
+    '''Returns map `map_index` in the form expected by `astar`, and its
+    labels (see `label_components`), converting and labeling it only when
+    the worker moves on to a different map.'''
+    if _shared['map_index'] != map_index:
+        start, end = _shared['map_offsets'][map_index:map_index+2]
+        map_data = _shared['buffer'][start:end].reshape(_shared['shapes'][map_index])
+        _shared['map_astar'] = 1 - map_data.T
+        # map's x and y get switched in numpy, hence the transpose
+        _shared['labels'] = label_components(map_data)
+        _shared['map_index'] = map_index
+        # NOTE: Chunks are handed out map after map, hence each worker
+        #       converts and labels a map once, whatever its number of chunks.
+
+    return _shared['map_astar'], _shared['labels']
+
+
+def solve_queries(map_astar, queries, labels=None):
+    '''Solves many queries on a single map, in the calling process.
+
+    Parameters
+    ----------
+    map_astar : np.ndarray, shape (width, height)
+        Map in the form expected by `astar` (indexed as [x_map][y_map], with 0
+        for walkable tiles).
+    queries : array-like, shape (n_queries, 4)
+        Rows are (x_start, y_start, x_goal, y_goal).
+    labels : np.ndarray, shape (height, width), optional (default: None)
+        Labels of the map (see `label_components`), if already computed.
+
+    Queries whose start and goal lie in different islands are rejected without
+    any search (see `label_components`), while queries out of the map raise a
+    `ValueError`.
+
+    Returns
+    -------
+    lengths : np.ndarray, shape (n_queries,), dtype: int64
+        Number of waypoints of each path (0 if the goal is unreachable).
+    coords : np.ndarray, shape (sum(lengths), 2), dtype: int32
+        Concatenated [x_map, y_map] waypoints.
+    '''
+    queries = np.asarray(queries, dtype=np.int64).reshape(-1, 4)
+    width, height = np.shape(map_astar)
+    outside = (queries < 0).any(axis=1) | \
+        (queries[:, [0, 2]] >= width).any(axis=1) | \
+        (queries[:, [1, 3]] >= height).any(axis=1)
+    if outside.any():
+        raise ValueError('solve_queries:: query %s out of the %dx%d map' %
+                         (queries[np.argmax(outside)].tolist(), width, height))
+        # NOTE: Negative coordinates would otherwise wrap around silently.
+
+    lengths = np.zeros(len(queries), dtype=np.int64)
+    paths = []
+    if labels is None:
+        labels = label_components(map_astar == 0).T
+        # indexed as [y_map][x_map], as the map data
+    for i, (x_start, y_start, x_goal, y_goal) in enumerate(queries):
+        if not is_reachable(labels, (x_start, y_start), (x_goal, y_goal)):
+            continue
+            # empty or unreachable target tile
+
+        path = astar(map_astar, (x_start, y_start), (x_goal, y_goal))
+        if path is not None:
+            lengths[i] = len(path)
+            paths.extend(path)
+
+    coords = np.array(paths, dtype=np.int32).reshape(-1, 2)
+
+    return lengths, coords
+
+
+def _solve_chunk(task):
+    '''Solves a chunk of queries on a single shared map (see
+    `solve_queries`).'''
+    map_index, queries = task
+
+    map_astar, labels = _get_map(map_index)
+
+    return solve_queries(map_astar, queries, labels=labels)
+
+
+def find_paths_batch(maps, queries, n_workers=None, chunk_size=256):
+    '''Runs `astar` on many (start, goal) queries over many maps.
+
+    All the maps are copied once into a shared memory block, which the worker
+    processes attach to on startup: only the queries travel with each task.
+    Queries are split into chunks of `chunk_size`, fanned out to a process
+    pool, and the resulting paths are packed into two arrays.
+
+    Parameters
+    ----------
+    maps : sequence of array-like, shape (height, width)
+        Map data in numerical form (0 = no tile), indexed as [y_map][x_map].
+    queries : sequence of array-like, shape (n_queries, 4)
+        One array per map, whose rows are (x_start, y_start, x_goal, y_goal).
+    n_workers : int, optional (default: None)
+        Number of worker processes (None: as many as CPUs). If 1, queries are
+        solved in the calling process.
+    chunk_size : int, optional (default: 256)
+        Number of queries sent to a worker at once.
+
+    Returns
+    -------
+    offsets : np.ndarray, shape (n_total_queries + 1,), dtype: int64
+        Path `i` (queries numbered map after map) spans
+        `coords[offsets[i]:offsets[i+1]]`. Empty paths mark unreachable goals.
+    coords : np.ndarray, shape (n_points, 2), dtype: int32
+        Concatenated [x_map, y_map] waypoints, start and goal included.
+    '''
+    maps = [np.asarray(map_data) != 0 for map_data in maps]
+    shapes = [map_data.shape for map_data in maps]
+    map_offsets = np.concatenate(
+        [[0], np.cumsum([map_data.size for map_data in maps])]).astype(np.int64)
+
+    # Chunks of queries, map after map:
+    tasks = []
+    for map_index, map_queries in enumerate(queries):
+        map_queries = np.asarray(map_queries, dtype=np.int64).reshape(-1, 4)
+        for start in range(0, len(map_queries), chunk_size):
+            tasks.append((map_index, map_queries[start:start+chunk_size]))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, map_offsets[-1]))
+    try:
+        buffer = np.ndarray((map_offsets[-1],), dtype=np.uint8, buffer=shm.buf)
+        for map_index, map_data in enumerate(maps):
+            buffer[map_offsets[map_index]:map_offsets[map_index+1]] = \
+                map_data.ravel()
+        del buffer
+        # NOTE: No view on the buffer may survive, or `shm.close` fails.
+
+        initargs = (shm.name, shapes, map_offsets)
+        if n_workers == 1:
+            _init_worker(*initargs)
+            try:
+                results = [_solve_chunk(task) for task in tasks]
+            finally:
+                worker_shm = _shared['shm']
+                _shared.clear()
+                worker_shm.close()
+                # NOTE: The worker's own handle (closed after dropping its
+                #       views) is closed before ours, even if a query fails.
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers,
+                                     initializer=_init_worker,
+                                     initargs=initargs) as executor:
+                results = list(executor.map(_solve_chunk, tasks))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    # Packing:
+    lengths = [np.zeros(0, dtype=np.int64)] + [r[0] for r in results]
+    offsets = np.concatenate([[0], np.cumsum(np.concatenate(lengths))])
+    coords = np.concatenate([np.zeros((0, 2), dtype=np.int32)] +
+                            [r[1] for r in results])
+
+    return offsets.astype(np.int64), coords
+
+
+def unpack_paths(offsets, coords):
+    '''Splits packed paths back into a list of (n_waypoints, 2) arrays.'''
+    return np.split(coords, offsets[1:-1])
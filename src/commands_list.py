@@ -19,6 +19,10 @@ class CommandsList:
             "Arrows: Move", "",
             "M: Random Map", "",
             "Enter: Auto-move to dest", "",
+            "F: Fast-forward", "",
+            "[ / ]: Slower / faster", "",
+            "P: Frame profiler", "",
+            "O: Dump profile (CSV)", "",
             "Esc: Quit", "",
         ]
         # NOTE: The extra "" are for carriage returns
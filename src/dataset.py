@@ -0,0 +1,196 @@
+'''
+Generates a dataset of maps, sampled (start, goal) pairs and their `astar`
+paths (the ground truth for learning-based policies), as fixed-size shards.
+
+Shards are generated independently by a process pool, each from its own seed,
+and written atomically: an interrupted run is resumed by re-launching the same
+command, which skips the shards already on disk. Each worker holds a single
+shard in memory at a time.
+
+Usage:
+    python -m src.dataset data/datasets/traversable_64 --n-shards 100 \
+        --maps-per-shard 1000 --queries-per-map 16 --size 64 64
+
+Shard format ('.npz', maps readable with `read_map_file`):
+    bits, shape   : bit-packed stack of maps, of shape (n_maps, height, width)
+    seed          : seed the stack of maps and the queries were drawn from
+    queries       : (n_maps * n_queries, 4) rows of (x_start, y_start,
+                    x_goal, y_goal), map after map
+    offsets       : path `i` spans `coords[offsets[i]:offsets[i+1]]` (empty
+                    paths mark unreachable goals)
+    coords        : concatenated [x_map, y_map] waypoints
+'''
+import argparse
+import json
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# src:
+from src.map_generators import create_simple_map, create_traversable_map
+from src.batch_paths import solve_queries
+
+
+def shard_seed(seed, shard_index):
+    '''Derives the seed of a shard from the dataset seed.'''
+    return int(np.random.SeedSequence([seed, shard_index]).generate_state(
+        1, dtype=np.uint64)[0] >> 1)
+
+
+def sample_queries(maps, n_queries, rng):
+    '''Samples (start, goal) pairs among the walkable tiles of each map.
+
+    Returns
+    -------
+    queries : np.ndarray, shape (n_maps * n_queries, 4), dtype: int32
+        Rows of (x_start, y_start, x_goal, y_goal), map after map.
+    '''
+    n_maps, height, width = maps.shape
+    queries = np.zeros((n_maps, n_queries, 4), dtype=np.int32)
+
+    for map_index in range(n_maps):
+        walkable = np.flatnonzero(maps[map_index])
+        if len(walkable) == 0:
+            continue
+        tiles = walkable[rng.integers(0, len(walkable), (n_queries, 2))]
+        y_map, x_map = np.divmod(tiles, width)
+        queries[map_index] = np.stack(
+            (x_map[:, 0], y_map[:, 0], x_map[:, 1], y_map[:, 1]), axis=1)
+
+    return queries.reshape(-1, 4)
+
+
+def generate_shard(path_to_shard, seed, n_maps, n_queries, width, height,
+                   map_type='traversable', p=0.5):
+    '''Generates one shard and writes it atomically to `path_to_shard`.
+
+    Returns
+    -------
+    n_samples : int
+        Number of (start, goal, path) samples in the shard.
+    '''
+    rng = np.random.default_rng(seed)
+
+    if map_type == 'simple':
+        maps = create_simple_map(width, height, p_hole=p, rng=rng,
+                                 n_maps=n_maps)
+    if map_type == 'traversable':
+        maps = create_traversable_map(height, width, p_tile=p, rng=rng,
+                                      n_maps=n_maps)
+
+    queries = sample_queries(maps, n_queries, rng)
+
+    # Ground truth paths:
+    lengths, coords = [], []
+    for map_index in range(n_maps):
+        map_astar = 1 - maps[map_index].T
+        # map's x and y get switched in numpy, hence the transpose
+        map_lengths, map_coords = solve_queries(
+            map_astar, queries[map_index*n_queries:(map_index+1)*n_queries])
+        lengths.append(map_lengths)
+        coords.append(map_coords)
+    offsets = np.concatenate([[0], np.cumsum(np.concatenate(lengths))])
+
+    # Atomic write (a shard on disk is always complete):
+    path_to_tmp = path_to_shard[:-len('.npz')] + '.tmp.npz'
+    np.savez(path_to_tmp, bits=np.packbits(maps), seed=np.int64(seed),
+             shape=np.array(maps.shape, dtype=np.int64),
+             queries=queries, offsets=offsets.astype(np.int64),
+             coords=np.concatenate(coords))
+    os.replace(path_to_tmp, path_to_shard)
+
+    return len(queries)
+
+
+def generate_dataset(path_to_dataset, n_shards, n_maps, n_queries, width,
+                     height, map_type='traversable', p=0.5, seed=0,
+                     n_workers=None):
+    '''Generates the missing shards of a dataset, reporting the throughput.
+
+    Parameters
+    ----------
+    path_to_dataset : str
+        Output folder. Its 'config.json' records the generation parameters,
+        which must match when resuming or adding shards.
+    n_shards : int
+        Number of shards.
+    n_maps : int
+        Maps per shard.
+    n_queries : int
+        (start, goal) pairs per map.
+    width, height : int
+        Map size in tiles.
+    map_type : str, optional (default: 'traversable')
+        Either 'simple' or 'traversable' (see `World.generate_map`).
+    p : float, optional (default: 0.5)
+        Hole (simple) or tile (traversable) probability.
+    seed : int, optional (default: 0)
+        Dataset seed, from which each shard's seed is derived.
+    n_workers : int, optional (default: None)
+        Number of worker processes (None: as many as CPUs).
+    '''
+    if not os.path.exists(path_to_dataset): os.makedirs(path_to_dataset)
+
+    config = dict(n_maps=n_maps, n_queries=n_queries, width=width,
+                  height=height, map_type=map_type, p=p, seed=seed)
+    # NOTE: The number of shards is left out, so that a dataset can be grown.
+    path_to_config = os.path.join(path_to_dataset, 'config.json')
+    if os.path.exists(path_to_config):
+        with open(path_to_config) as file:
+            if json.load(file) != config:
+                raise ValueError('generate_dataset:: %s was generated with '
+                                 'different parameters' % path_to_dataset)
+    else:
+        with open(path_to_config, 'w') as file:
+            json.dump(config, file, indent=4)
+
+    # Resuming:
+    done = set(os.listdir(path_to_dataset))
+    todo = [i for i in range(n_shards) if 'shard_%05d.npz' % i not in done]
+    print('generate_dataset:: %d/%d shards to generate' %
+          (len(todo), n_shards))
+
+    time_start = time.perf_counter()
+    n_samples = 0
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(
+            generate_shard,
+            os.path.join(path_to_dataset, 'shard_%05d.npz' % i),
+            shard_seed(seed, i), n_maps, n_queries, width, height, map_type, p)
+            for i in todo]
+
+        for n_done, future in enumerate(as_completed(futures), 1):
+            n_samples += future.result()
+            elapsed = time.perf_counter() - time_start
+            rate = n_samples / elapsed
+            eta = elapsed / n_done * (len(todo) - n_done)
+            print('generate_dataset:: %d/%d shards | %d samples | '
+                  '%.0f samples/s | ETA %.0f s' %
+                  (n_done, len(todo), n_samples, rate, eta))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path_to_dataset', help='output folder')
+    parser.add_argument('--n-shards', type=int, default=100)
+    parser.add_argument('--maps-per-shard', type=int, default=1000)
+    parser.add_argument('--queries-per-map', type=int, default=16)
+    parser.add_argument('--size', type=int, nargs=2, default=(64, 64),
+                        metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--type', default='traversable',
+                        choices=['simple', 'traversable'])
+    parser.add_argument('--p', type=float, default=0.5,
+                        help='hole (simple) or tile (traversable) probability')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    generate_dataset(args.path_to_dataset, args.n_shards, args.maps_per_shard,
+                     args.queries_per_map, args.size[0], args.size[1],
+                     map_type=args.type, p=args.p, seed=args.seed,
+                     n_workers=args.workers)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+import heapq
+import time
+import numpy as np
+
+# src:
+from src.astar import SQRT2
+
+# Adjacent squares, as (dx_map, dy_map, step cost):
+NEIGHBORS = [(0, -1, 1.), (0, 1, 1.), (-1, 0, 1.), (1, 0, 1.),
+             (-1, -1, SQRT2), (-1, 1, SQRT2), (1, -1, SQRT2), (1, 1, SQRT2)]
+
+INF = float('inf')
+
+
+class DStarLite:
+    '''
+    Incremental path-finding (D* Lite) towards a fixed goal tile.
+
+    The search runs backwards, from the goal, and its tree is kept between
+    queries: when the start moves (see `update_start`) or some tiles of the
+    world's map change, only the part of the tree affected by the change gets
+    repaired, which is usually a small fraction of a full `astar` search.
+
+    Moves and costs are those of `astar`: 8-connected, straight steps cost 1
+    and diagonal steps sqrt(2), only walkable tiles can be entered, while the
+    start may be any tile.
+
+    Parameters
+    ----------
+    map_data : array-like, shape (height, width)
+        Map data in numerical form (0 = no tile), indexed as [y_map][x_map].
+    goal : tuple
+        Goal tile, as (x_map, y_map).
+    world : World, optional (default: None)
+        If given, the planner registers itself as a listener of the world's
+        map (see `World.add_map_listener`), so that it follows its changes.
+        Call `detach` when it is no longer needed.
+    '''
+    def __init__(self, map_data, goal, world=None):
+        self.world = world
+        self.goal = (int(goal[0]), int(goal[1]))
+        self.start = self.goal
+
+        self.reset(map_data)
+        if world is not None:
+            world.add_map_listener(self.on_map_change)
+
+    def detach(self):
+        '''Stops following the changes of the world's map.'''
+        if self.world is not None:
+            self.world.remove_map_listener(self.on_map_change)
+            self.world = None
+
+    def reset(self, map_data):
+        '''Drops the search tree, and starts over on the given map.'''
+        self.map_data = map_data
+        walkable = np.asarray(map_data) != 0
+        self.height, self.width = walkable.shape
+        stride = self.width + 2
+        self.stride = stride
+        # padded row stride
+
+        padded = np.zeros((self.height + 2, stride), dtype=np.uint8)
+        padded[1:-1, 1:-1] = walkable
+        self.walkable = bytearray(padded.tobytes())
+        padded[1:-1, 1:-1] = 1
+        self.inside = bytes(padded.tobytes())
+        # NOTE: The map is padded with a border of non-walkable tiles, which
+        #       are not search states either, so that neighbors are reached
+        #       through constant flat offsets, without range checks.
+
+        self.offsets = [(dy_map * stride + dx_map, cost)
+                        for dx_map, dy_map, cost in NEIGHBORS]
+
+        n_tiles = len(self.walkable)
+        self.g = [INF] * n_tiles
+        self.rhs = [INF] * n_tiles
+        # cost to the goal, and its one-step lookahead
+
+        self.queue = []
+        self.keys = {}
+        # open set: heap of (k1, k2, tile) entries, and the current key of each
+        # queued tile. Stale heap entries are skipped when met.
+        self.km = 0.
+        # key modifier, accumulating the heuristic shifts of the start
+
+        self._update_goal()
+
+    def _update_goal(self):
+        '''Sets the goal's cost to 0, or to infinity while it is a hole (no
+        tile then leads to it).'''
+        i_goal = self._index(self.goal)
+        self.rhs[i_goal] = 0. if self.walkable[i_goal] else INF
+        self._update_vertex(i_goal)
+
+    def _index(self, tile):
+        '''Flat index of a (x_map, y_map) tile.'''
+        return (tile[1] + 1) * self.stride + tile[0] + 1
+
+    def _tile(self, i):
+        '''(x_map, y_map) tile of a flat index.'''
+        row, col = divmod(i, self.stride)
+        return col - 1, row - 1
+
+    def _heuristic(self, a, b):
+        '''Octile distance between two flat indices.'''
+        row_a, col_a = divmod(a, self.stride)
+        row_b, col_b = divmod(b, self.stride)
+        d_row = abs(row_a - row_b)
+        d_col = abs(col_a - col_b)
+        if d_row > d_col:
+            return d_row + (SQRT2 - 1) * d_col
+        return d_col + (SQRT2 - 1) * d_row
+
+    def _key(self, i):
+        g_min = min(self.g[i], self.rhs[i])
+        k1 = g_min + self._heuristic(self._index(self.start), i) + self.km
+        return (round(k1, 9), g_min)
+        # NOTE: k1 is rounded, as in `astar`, so that sums of sqrt(2) steps
+        #       which are equal up to float noise tie as they should.
+
+    def _push(self, i):
+        key = self._key(i)
+        self.keys[i] = key
+        heapq.heappush(self.queue, (*key, i))
+
+    def _top(self):
+        '''Returns the queued entry with the lowest key, or None.'''
+        queue, keys = self.queue, self.keys
+        while queue and keys.get(queue[0][2]) != queue[0][:2]:
+            heapq.heappop(queue)
+
+        return queue[0] if queue else None
+
+    def _lookahead(self, i):
+        '''Best cost to the goal through the successors of a tile.'''
+        g, walkable = self.g, self.walkable
+        best = INF
+        for offset, cost in self.offsets:
+            j = i + offset
+            if walkable[j] and cost + g[j] < best:
+                best = cost + g[j]
+
+        return best
+
+    def _update_vertex(self, i):
+        if self.g[i] != self.rhs[i]:
+            self._push(i)
+        else:
+            self.keys.pop(i, None)
+
+    def update_start(self, start):
+        '''Moves the start of the search to tile (x_map, y_map).'''
+        start = (int(start[0]), int(start[1]))
+        if start != self.start:
+            self.km += self._heuristic(self._index(self.start),
+                                       self._index(start))
+            # NOTE: The keys in the queue were computed from the old start,
+            #       hence are raised by the distance the start moved.
+            self.start = start
+
+    def on_map_change(self, map_data, tiles):
+        '''Map listener: repairs the tree after some tiles changed.
+
+        Parameters
+        ----------
+        map_data : array-like, shape (height, width)
+            The changed map.
+        tiles : list, or None
+            Changed tiles, as [x_map, y_map]. If None (e.g. a new map), the
+            search starts over.
+        '''
+        if tiles is None or np.shape(map_data) != (self.height, self.width):
+            self.reset(map_data)
+            return
+
+        self.map_data = map_data
+        i_goal = self._index(self.goal)
+        for x_map, y_map in tiles:
+            i = self._index((x_map, y_map))
+            is_walkable = int(map_data[y_map][x_map] != 0)
+            if self.walkable[i] == is_walkable:
+                continue
+            self.walkable[i] = is_walkable
+            if i == i_goal:
+                self._update_goal()
+
+            # Entering the tile got cheaper or dearer, for its neighbors:
+            for offset, _ in self.offsets:
+                j = i - offset
+                if self.inside[j] and j != i_goal:
+                    self.rhs[j] = self._lookahead(j)
+                    self._update_vertex(j)
+
+    def compute_shortest_path(self, stats=None):
+        '''Expands tiles until the cost from the start is settled.
+
+        Parameters
+        ----------
+        stats : dict, optional (default: None)
+            If given, filled with the number of 'expanded' tiles and the
+            search 'time' in seconds.
+        '''
+        time_start = time.perf_counter()
+
+        g, rhs, walkable, inside = self.g, self.rhs, self.walkable, self.inside
+        i_start = self._index(self.start)
+        i_goal = self._index(self.goal)
+        n_expanded = 0
+
+        while True:
+            top = self._top()
+            if top is None:
+                break
+            if top[:2] >= self._key(i_start) and rhs[i_start] == g[i_start]:
+                break
+            i = top[2]
+            n_expanded += 1
+
+            key = self._key(i)
+            if top[:2] < key:
+                self._push(i)
+                # outdated key
+
+            elif g[i] > rhs[i]:
+                # Over-consistent: the tile's cost settles
+                g[i] = rhs[i]
+                del self.keys[i]
+                if not walkable[i]:
+                    continue
+                    # no tile can step into it
+                for offset, cost in self.offsets:
+                    j = i - offset
+                    if inside[j] and j != i_goal and cost + g[i] < rhs[j]:
+                        rhs[j] = cost + g[i]
+                        self._update_vertex(j)
+
+            else:
+                # Under-consistent: the tile's cost went up
+                g_old = g[i]
+                g[i] = INF
+                if i != i_goal:
+                    rhs[i] = self._lookahead(i)
+                self._update_vertex(i)
+                if not walkable[i]:
+                    continue
+                for offset, cost in self.offsets:
+                    j = i - offset
+                    if inside[j] and j != i_goal and rhs[j] == cost + g_old:
+                        rhs[j] = self._lookahead(j)
+                        self._update_vertex(j)
+
+        if stats is not None:
+            stats['expanded'] = n_expanded
+            stats['time'] = time.perf_counter() - time_start
+
+    def extract_path(self, stats=None):
+        '''Returns the current path from the start to the goal, repairing the
+        search tree first if needed.
+
+        Parameters
+        ----------
+        stats : dict, optional (default: None)
+            As in `compute_shortest_path`.
+
+        Returns
+        -------
+        path : list of tuples, or None
+            (x_map, y_map) positions from the start to the goal (both
+            included), or None if the goal is not reachable.
+        '''
+        self.compute_shortest_path(stats=stats)
+
+        g, walkable = self.g, self.walkable
+        i = self._index(self.start)
+        i_goal = self._index(self.goal)
+        if not walkable[i_goal] or (self.rhs[i] == INF and i != i_goal):
+            return None
+            # NOTE: The goal may have turned into a hole since the tree was
+            #       grown towards it.
+
+        path = [self.start]
+        while i != i_goal:
+            # Greedy descent of the cost to the goal:
+            best, i_next = INF, None
+            for offset, cost in self.offsets:
+                j = i + offset
+                if walkable[j] and cost + g[j] < best:
+                    best, i_next = cost + g[j], j
+            if i_next is None or len(path) > len(g):
+                return None
+            i = i_next
+            path.append(self._tile(i))
+
+        return path
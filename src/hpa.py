@@ -0,0 +1,460 @@
+import heapq
+import time
+import numpy as np
+
+# src:
+from src.astar import NEIGHBORS, SQRT2, octile, astar
+from src.flow_field import compute_distance_fields
+
+
+class HierarchicalPlanner:
+    '''
+    Hierarchical path-finding (HPA*) on large maps.
+
+    The map is partitioned into square clusters. Entrances are placed where
+    adjacent clusters can be crossed, and the costs between the entrances of
+    each cluster are precomputed, which gives an abstract graph much smaller
+    than the map. Queries connect start and goal to the entrances of their
+    clusters (and to each other, within a shared cluster), search the
+    abstract graph, and refine each abstract edge with a local `astar`
+    restricted to one cluster.
+
+    Paths cross cluster borders at entrances only, hence may be longer than
+    `astar`'s: on random 256x256 maps, by ~1.5% on average and 5% at most,
+    and up to ~1.4x for short paths hopping across a border. The build takes
+    ~1.5 s on a 512x512 map (~7 s at 1024x1024), and queries between random
+    tiles ~10-30 ms (~30-100 ms for `astar`).
+
+    When some tiles change (see `update`), only the clusters containing them,
+    and the neighbors sharing a border with those, are rebuilt.
+
+    Parameters
+    ----------
+    map_data : array-like, shape (height, width)
+        Map data in numerical form (0 = no tile), indexed as [y_map][x_map].
+    cluster_size : int, optional (default: 16)
+        Side of the clusters, in tiles.
+    '''
+    def __init__(self, map_data, cluster_size=16):
+        self.cluster_size = cluster_size
+        self.build(map_data)
+
+    # Construction ############################################################
+
+    def build(self, map_data):
+        '''(Re)builds the whole abstract graph.'''
+        self.walkable = np.asarray(map_data) != 0
+        self.height, self.width = self.walkable.shape
+        K = self.cluster_size
+        self.n_clusters_y = -(-self.height // K)
+        self.n_clusters_x = -(-self.width // K)
+
+        self.borders = {}
+        # (kind, cluster_row, cluster_col) -> list of (node_a, node_b, cost)
+        self.inter = {}
+        # node -> {node in another cluster: cost}
+        self.intra = {}
+        # cluster -> {node: {node in the same cluster: cost}}
+        self.edges = {}
+        # node -> [(node, cost)], intra and inter edges merged for the search
+
+        for key in self._all_borders():
+            self._build_border(key)
+        self._build_clusters(
+            list(np.ndindex(self.n_clusters_y, self.n_clusters_x)))
+
+    def update(self, map_data, tiles=None):
+        '''Updates the abstract graph after a map change.
+
+        Parameters
+        ----------
+        map_data : array-like, shape (height, width)
+            The changed map.
+        tiles : list, optional (default: None)
+            Changed tiles, as [x_map, y_map]. If None (e.g. a new map), the
+            whole graph is rebuilt.
+        '''
+        if tiles is None or np.shape(map_data) != self.walkable.shape:
+            self.build(map_data)
+            return
+
+        self.walkable = np.asarray(map_data) != 0
+
+        dirty = {self.cluster_of((y_map, x_map)) for x_map, y_map in tiles}
+
+        # Borders touching a dirty cluster, and clusters on their other side:
+        borders = {key for cluster in dirty
+                   for key in self._cluster_borders(cluster)}
+        clusters = set(dirty)
+        for key in borders:
+            self._build_border(key)
+            clusters.update(self._border_clusters(key))
+
+        self._build_clusters(list(clusters))
+
+    def cluster_of(self, node):
+        '''Returns the (cluster_row, cluster_col) of a (row, col) tile.'''
+        return node[0] // self.cluster_size, node[1] // self.cluster_size
+
+    def _cluster_bounds(self, cluster):
+        '''Returns the (row_min, row_max, col_min, col_max) tiles of a
+        cluster, max excluded.'''
+        K = self.cluster_size
+        return (cluster[0] * K, min((cluster[0] + 1) * K, self.height),
+                cluster[1] * K, min((cluster[1] + 1) * K, self.width))
+
+    def _all_borders(self):
+        '''Yields the keys of all borders between adjacent clusters:
+        'h' (left-right), 'v' (top-bottom), 'd' (top-left/bottom-right
+        corners) and 'a' (top-right/bottom-left corners).'''
+        for cr in range(self.n_clusters_y):
+            for cc in range(self.n_clusters_x):
+                if cc + 1 < self.n_clusters_x:
+                    yield ('h', cr, cc)
+                if cr + 1 < self.n_clusters_y:
+                    yield ('v', cr, cc)
+                if cc + 1 < self.n_clusters_x and cr + 1 < self.n_clusters_y:
+                    yield ('d', cr, cc)
+                    yield ('a', cr, cc)
+
+    def _cluster_borders(self, cluster):
+        '''Returns the keys of the borders touching a cluster.'''
+        cr, cc = cluster
+        keys = [('h', cr, cc), ('h', cr, cc - 1), ('v', cr, cc),
+                ('v', cr - 1, cc), ('d', cr, cc), ('d', cr - 1, cc - 1),
+                ('a', cr, cc - 1), ('a', cr - 1, cc)]
+
+        return [key for key in keys if key in self.borders]
+
+    def _border_clusters(self, key):
+        '''Returns the two clusters sharing a border.'''
+        kind, cr, cc = key
+        if kind == 'h': return (cr, cc), (cr, cc + 1)
+        if kind == 'v': return (cr, cc), (cr + 1, cc)
+        if kind == 'd': return (cr, cc), (cr + 1, cc + 1)
+        return (cr, cc + 1), (cr + 1, cc)
+
+    def _build_border(self, key):
+        '''Places the entrances (pairs of tiles across the border) of a
+        border, replacing the previous ones.'''
+        W = self.walkable
+        K = self.cluster_size
+        kind, cr, cc = key
+
+        # Removing old entrances:
+        for a, b, _ in self.borders.get(key, []):
+            self.inter[a].pop(b, None)
+            self.inter[b].pop(a, None)
+
+        transitions = []
+        if kind in ('d', 'a'):
+            row, col = (cr + 1) * K, (cc + 1) * K
+            # first tile of the bottom-right cluster
+            if kind == 'd': a, b = (row - 1, col - 1), (row, col)
+            else:           a, b = (row - 1, col), (row, col - 1)
+            if W[a] and W[b]:
+                transitions.append((a, b, SQRT2))
+
+        else:
+            # Tiles on both sides, along the border:
+            if kind == 'h':
+                col = (cc + 1) * K - 1
+                row_min, row_max = cr * K, min((cr + 1) * K, self.height)
+                line = [((i, col), (i, col + 1))
+                        for i in range(row_min, row_max)]
+            else:
+                row = (cr + 1) * K - 1
+                col_min, col_max = cc * K, min((cc + 1) * K, self.width)
+                line = [((row, i), (row + 1, i))
+                        for i in range(col_min, col_max)]
+            straight = [bool(W[a] and W[b]) for a, b in line]
+
+            # Runs of straight crossings: one entrance in the middle of short
+            # runs, two at the ends of long ones.
+            i = 0
+            while i < len(line):
+                if not straight[i]:
+                    i += 1
+                    continue
+                j = i
+                while j + 1 < len(line) and straight[j+1]:
+                    j += 1
+                for k in ({(i + j) // 2} if j - i + 1 < 6 else {i, j}):
+                    transitions.append((*line[k], 1.))
+                i = j + 1
+
+            # Diagonal crossings, only where no straight run can be reached
+            # (otherwise they add nothing to connectivity):
+            for i in range(len(line) - 1):
+                if straight[i] or straight[i+1]:
+                    continue
+                (a0, b0), (a1, b1) = line[i], line[i+1]
+                if W[a0] and W[b1]:
+                    transitions.append((a0, b1, SQRT2))
+                if W[a1] and W[b0]:
+                    transitions.append((a1, b0, SQRT2))
+
+        self.borders[key] = transitions
+        for a, b, cost in transitions:
+            self.inter.setdefault(a, {})[b] = cost
+            self.inter.setdefault(b, {})[a] = cost
+
+    def _cluster_nodes(self, cluster):
+        '''Returns the entrance tiles lying in a cluster.'''
+        nodes = set()
+        for key in self._cluster_borders(cluster):
+            for a, b, _ in self.borders[key]:
+                nodes.update(node for node in (a, b)
+                             if self.cluster_of(node) == cluster)
+
+        return sorted(nodes)
+
+    def _local_distances(self, clusters, nodes):
+        '''Returns the distance fields from each node, within its cluster
+        only, as a (n_nodes, cluster_size, cluster_size) stack (tiles past
+        the map edge are non-walkable), indexed from each cluster's origin.'''
+        K = self.cluster_size
+        walkable = np.zeros((len(nodes), K, K), dtype=bool)
+        sources = np.zeros((len(nodes), 2), dtype=np.int64)
+        for i, (cluster, node) in enumerate(zip(clusters, nodes)):
+            row_min, row_max, col_min, col_max = self._cluster_bounds(cluster)
+            walkable[i, :row_max-row_min, :col_max-col_min] = \
+                self.walkable[row_min:row_max, col_min:col_max]
+            sources[i] = node[1] - col_min, node[0] - row_min
+
+        return compute_distance_fields(walkable, sources)
+
+    def _build_clusters(self, clusters, batch_size=4096):
+        '''Computes the costs between all the entrances of each cluster.
+
+        The distance fields from all the entrances are computed in stacks of
+        about `batch_size` (whole clusters each), by a single vectorized
+        wavefront each.
+        '''
+        nodes = {cluster: self._cluster_nodes(cluster) for cluster in clusters}
+        for cluster in clusters:
+            for node in self.intra.get(cluster, ()):
+                self.edges.pop(node, None)
+                # dropping the previous entrances
+
+        # Batches of whole clusters:
+        batches, batch, n_sources = [], [], 0
+        for cluster in clusters:
+            batch.append(cluster)
+            n_sources += len(nodes[cluster])
+            if n_sources >= batch_size:
+                batches.append(batch)
+                batch, n_sources = [], 0
+        if batch:
+            batches.append(batch)
+
+        for batch in batches:
+            sources = [(cluster, node) for cluster in batch
+                       for node in nodes[cluster]]
+            if sources:
+                distances = self._local_distances(*zip(*sources))
+
+            first = 0
+            for cluster in batch:
+                cluster_nodes = nodes[cluster]
+                if not cluster_nodes:
+                    self.intra[cluster] = {}
+                    continue
+                last = first + len(cluster_nodes)
+                row_min, _, col_min, _ = self._cluster_bounds(cluster)
+                rows = [node[0] - row_min for node in cluster_nodes]
+                cols = [node[1] - col_min for node in cluster_nodes]
+                costs = distances[first:last][:, rows, cols]
+                # (from, to) costs between the cluster's entrances
+                first = last
+
+                self.intra[cluster] = {
+                    node: {other: d for other, d in zip(cluster_nodes, row)
+                           if d != np.inf}
+                    for node, row in zip(cluster_nodes,
+                                         self._prune(costs).tolist())}
+                for node, edges in self.intra[cluster].items():
+                    self.edges[node] = list(edges.items()) + \
+                        list(self.inter.get(node, {}).items())
+
+    @staticmethod
+    def _prune(costs):
+        '''Sets to infinity the costs between entrances (and to themselves)
+        that are as short through another entrance of the cluster: the
+        abstract graph keeps the same distances, with fewer edges.'''
+        costs = costs.copy()
+        np.fill_diagonal(costs, np.inf)
+        through = (costs[:, :, None] + costs[None, :, :]).min(axis=1)
+        # shortest (from, to) cost through a third entrance
+        costs[through <= costs + 1e-9] = np.inf
+
+        return costs
+
+    # Queries #################################################################
+
+    def _local_path(self, cluster, a, b):
+        '''Returns the `astar` path from tile `a` to tile `b`, within a
+        cluster only (list of (row, col) tuples, or None).'''
+        row_min, row_max, col_min, col_max = self._cluster_bounds(cluster)
+        maze = ~self.walkable[row_min:row_max, col_min:col_max]
+        path = astar(maze, (a[0] - row_min, a[1] - col_min),
+                           (b[0] - row_min, b[1] - col_min))
+        if path is None:
+            return None
+
+        return [(row + row_min, col + col_min) for row, col in path]
+
+    def _start_tiles(self, start):
+        '''Returns the walkable tiles a search from `start` begins on, with
+        the cost to step on them: the start itself or, as in `astar`, the
+        walkable neighbors of a start in a hole (in any cluster).'''
+        if self.walkable[start]:
+            return [(start, 0.)]
+
+        tiles = []
+        for d_row, d_col, cost in NEIGHBORS:
+            tile = (start[0] + d_row, start[1] + d_col)
+            if (0 <= tile[0] < self.height and 0 <= tile[1] < self.width
+                    and self.walkable[tile]):
+                tiles.append((tile, cost))
+
+        return tiles
+
+    def find_path(self, start, goal, stats=None):
+        '''Returns a path from `start` to `goal`.
+
+        Parameters
+        ----------
+        start, goal : tuple
+            Tiles, as (x_map, y_map).
+            The start tile may be a hole, as in `astar`.
+        stats : dict, optional (default: None)
+            If given, filled with the number of 'expanded' abstract nodes and
+            the search 'time' in seconds.
+
+        Returns
+        -------
+        path : list of tuples, or None
+            (x_map, y_map) positions from `start` to `goal` (both included),
+            or None if the goal is not reachable.
+        '''
+        time_start = time.perf_counter()
+        start = (int(start[1]), int(start[0]))
+        goal = (int(goal[1]), int(goal[0]))
+        # (row, col), from now on
+        path = None
+        n_expanded = 0
+
+        if self.walkable[goal]:
+            path, n_expanded = self._abstract_path(start, goal)
+
+        if stats is not None:
+            stats['expanded'] = n_expanded
+            stats['time'] = time.perf_counter() - time_start
+
+        if path is None:
+            return None
+
+        return [(col, row) for row, col in path]
+
+    def _abstract_path(self, start, goal):
+        '''Searches the abstract graph, then refines it into tiles.'''
+        cluster_goal = self.cluster_of(goal)
+        start_tiles = self._start_tiles(start)
+        clusters = [self.cluster_of(tile) for tile, _ in start_tiles]
+
+        distances = self._local_distances(
+            clusters + [cluster_goal],
+            [tile for tile, _ in start_tiles] + [goal])
+
+        # Temporary edges from the start, through each tile it begins on, to
+        # the entrances of the tile's cluster (and to the goal, when in the
+        # same cluster: a path may stay within it, or leave it if shorter):
+        start_edges = {}
+        # node -> (cost, tile the edge goes through)
+        for (tile, cost), cluster, distance in zip(start_tiles, clusters,
+                                                   distances):
+            row_min, _, col_min, _ = self._cluster_bounds(cluster)
+            nodes = list(self.intra[cluster])
+            if cluster == cluster_goal:
+                nodes.append(goal)
+            for node in nodes:
+                d = cost + distance[node[0] - row_min, node[1] - col_min]
+                if d < start_edges.get(node, (np.inf,))[0]:
+                    start_edges[node] = (float(d), tile)
+
+        # Temporary edges from the entrances of the goal's cluster:
+        goal_edges = {}
+        row_min, _, col_min, _ = self._cluster_bounds(cluster_goal)
+        for node in self.intra[cluster_goal]:
+            d = distances[-1][node[0] - row_min, node[1] - col_min]
+            if np.isfinite(d): goal_edges[node] = float(d)
+
+        start_neighbors = [(node, cost) for node, (cost, _) in
+                           start_edges.items()] + \
+            list(self.inter.get(start, {}).items())
+        # the start may be an entrance itself
+
+        # A* on the abstract graph:
+        g = {start: 0.}
+        parent = {start: None}
+        closed = set()
+        open_heap = [(octile(start, goal), 0., start)]
+        n_expanded = 0
+        edges = self.edges
+        row_goal, col_goal = goal
+        while open_heap:
+            _, g_node, node = heapq.heappop(open_heap)
+            if node in closed:
+                continue
+            closed.add(node)
+            n_expanded += 1
+            if node == goal:
+                break
+
+            neighbors = start_neighbors if node == start else \
+                edges.get(node, [])
+            if node in goal_edges:
+                neighbors = neighbors + [(goal, goal_edges[node])]
+            for other, cost in neighbors:
+                g_other = g_node + cost
+                if other in closed or g_other >= g.get(other, np.inf):
+                    continue
+                g[other] = g_other
+                parent[other] = node
+
+                # Octile heuristic, inlined (see `astar`):
+                d_row = abs(other[0] - row_goal)
+                d_col = abs(other[1] - col_goal)
+                if d_row > d_col:
+                    h_other = d_row + (SQRT2 - 1) * d_col
+                else:
+                    h_other = d_col + (SQRT2 - 1) * d_row
+                heapq.heappush(open_heap, (g_other + h_other, g_other, other))
+
+        if goal not in closed:
+            return None, n_expanded
+
+        abstract = [goal]
+        while parent[abstract[-1]] is not None:
+            abstract.append(parent[abstract[-1]])
+        abstract = abstract[::-1]
+
+        # Refinement, edge by edge:
+        path = [start]
+        for i, (a, b) in enumerate(zip(abstract[:-1], abstract[1:])):
+            if i == 0 and b in start_edges:
+                a = start_edges[b][1]
+                if a != start:
+                    path.append(a)
+                    # stepping out of the hole first
+            if a == b:
+                continue
+            cluster = self.cluster_of(a)
+            if cluster == self.cluster_of(b):
+                path.extend(self._local_path(cluster, a, b)[1:])
+            else:
+                path.append(b)
+                # entrance crossing, i.e. adjacent tiles
+
+        return path, n_expanded
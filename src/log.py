@@ -0,0 +1,141 @@
+'''
+Logging, with a level per subsystem ('player', 'world', 'simulation', ...).
+
+Subsystem loggers are children of the 'walker' logger of the standard
+`logging` module. Messages are formatted lazily, i.e. only once they pass the
+level check, so that disabled messages in per-tick code cost a method call:
+
+    log = get_logger('player')
+    log.debug('move_to:: (x, y): %.2f %.2f', x_map, y_map)
+
+Levels are WARNING by default, and can be set with `configure`, or from the
+environment when `configure` is called without levels, e.g.:
+
+    WALKER_LOG=player=DEBUG,world=INFO python main.py
+
+For debugging trajectories after the fact, `EventLog` records per-tick events
+to a compact binary file, through a buffer.
+'''
+import logging
+import os
+import numpy as np
+
+ROOT = 'walker'
+
+# Event log record (fixed size, little endian):
+EVENT_DTYPE = np.dtype([('tick', '<u4'), ('kind', 'u1'),
+                        ('x_map', '<f4'), ('y_map', '<f4'), ('z_map', '<f4')])
+EVENT_KINDS = {'step': 0, 'waypoint': 1, 'drop': 2}
+EVENT_MAGIC = b'WALKEVT1'
+# file header, followed by the records
+
+
+def get_logger(subsystem):
+    '''Returns the logger of a subsystem (e.g. 'player').'''
+    return logging.getLogger(ROOT + '.' + subsystem)
+
+
+def set_level(subsystem, level):
+    '''Sets the level of a subsystem, as a `logging` level or its name
+    (e.g. 'DEBUG').'''
+    get_logger(subsystem).setLevel(
+        level.upper() if isinstance(level, str) else level)
+
+
+def configure(levels=None, default='WARNING'):
+    '''Prints the messages of all the subsystems to stderr, and sets their
+    levels.
+
+    Parameters
+    ----------
+    levels : dict or str, optional (default: None)
+        Level of each subsystem, as {subsystem: level}, or as a string like
+        'player=DEBUG,world=INFO' (a bare level sets the default). If None,
+        it is read from the `WALKER_LOG` environment variable.
+    default : str or int, optional (default: 'WARNING')
+        Level of the subsystems not in `levels`.
+    '''
+    root = logging.getLogger(ROOT)
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        root.addHandler(handler)
+        root.propagate = False
+
+    if levels is None:
+        levels = os.environ.get('WALKER_LOG', '')
+
+    if isinstance(levels, str):
+        items = [item.split('=') for item in levels.split(',') if item]
+        levels = {}
+        for item in items:
+            if len(item) == 1: default = item[0]
+            else: levels[item[0].strip()] = item[1].strip()
+
+    root.setLevel(default.upper() if isinstance(default, str) else default)
+    for subsystem, level in levels.items():
+        set_level(subsystem, level)
+
+
+class EventLog:
+    '''
+    Buffered binary log of per-tick events (e.g. the player's position).
+
+    Records are kept in a preallocated array and appended to the file only
+    when the buffer is full (or on `flush`/`close`), so that recording costs
+    no I/O per tick. Read a log back with `read_event_log`.
+
+    Parameters
+    ----------
+    path_to_log : str
+        Path to the log file, overwritten.
+    buffer_size : int, optional (default: 4096)
+        Number of records buffered between writes.
+    '''
+    def __init__(self, path_to_log, buffer_size=4096):
+        self.path_to_log = path_to_log
+        self.buffer = np.zeros(buffer_size, dtype=EVENT_DTYPE)
+        self.n_buffered = 0
+
+        self.file = open(path_to_log, 'wb')
+        self.file.write(EVENT_MAGIC)
+
+    def record(self, tick, kind, x_map, y_map, z_map=0.):
+        '''Records an event of a kind in `EVENT_KINDS`.'''
+        self.buffer[self.n_buffered] = \
+            (tick, EVENT_KINDS[kind], x_map, y_map, z_map)
+        self.n_buffered += 1
+        if self.n_buffered == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer[:self.n_buffered].tobytes())
+        self.file.flush()
+        self.n_buffered = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_event_log(path_to_log):
+    '''Reads a file written by `EventLog`.
+
+    Returns
+    -------
+    events : np.ndarray, dtype: EVENT_DTYPE
+        Records, with fields 'tick', 'kind' (see `EVENT_KINDS`), 'x_map',
+        'y_map' and 'z_map'.
+    '''
+    with open(path_to_log, 'rb') as file:
+        if file.read(len(EVENT_MAGIC)) != EVENT_MAGIC:
+            raise ValueError('read_event_log:: %s is not an event log' %
+                             path_to_log)
+        return np.frombuffer(file.read(), dtype=EVENT_DTYPE)
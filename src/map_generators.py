@@ -1,8 +1,7 @@
-import random
 import numpy as np
 import os
 
-def create_simple_map(width, height, p_hole=1):
+def create_simple_map(width, height, p_hole=1, rng=None, n_maps=None):
     '''Generates a map predominantly filled with 1s (tiles), and, in a
      minor amount (less than 50%), 0s (holes).
     
@@ -16,6 +15,9 @@ def create_simple_map(width, height, p_hole=1):
     tile with a hole (`p_hole`).  When `p_hole` is max (=1), 50% of the tiles
     are holes.
 
+    The tiles are scanned row by row and column by column as in a single map,
+    but each step is vectorized over all the maps.
+
     Parameters
     ----------
     width : int
@@ -24,29 +26,47 @@ def create_simple_map(width, height, p_hole=1):
         Desired map height in pixels.
     p_hole : float, range: [0, 1]
         Probability to replace a tile with a hole.
+    rng : np.random.Generator or int, optional (default: None)
+        Random generator, or seed to create one: the same seed always gives
+        the same maps.
+    n_maps : int, optional (default: None)
+        If given, a stack of `n_maps` maps is generated at once.
 
     Returns
     -------
-    map_data : np.ndarray, dtype: int
-        A 2D array containing 1s and 0s.
+    map_data : np.ndarray, dtype: uint8
+        A 2D array containing 1s and 0s, or a 3D array of shape
+        (n_maps, height, width) if `n_maps` is given.
     '''
+    rng = np.random.default_rng(rng)
+    n = 1 if n_maps is None else n_maps
 
     # Step 1: Initialize a grid filled with 1s:
-    map_data = np.ones((height, width), dtype=int)
+    map_data = np.ones((n, height, width), dtype=np.uint8)
 
-    # Step 2: Random 0s placement:
+    # Step 2: Random 0s placement, row by row:
+    hole = np.zeros((width, n), dtype=bool)
+    # NOTE: Rows are laid out as (width, n_maps), so that each column is a
+    #       contiguous block of maps.
     for row in range(height):
-        for col in range(width):
-            if random.random() < p_hole:
-                # Ensuring barriers are not adjacent to each other:
-                if (row > 0 and map_data[row-1, col] == 0)\
-                or (col > 0 and map_data[row, col-1] == 0):
-                    continue
-                map_data[row, col] = 0
+        candidate = rng.random((width, n), dtype=np.float32) < p_hole
+        candidate &= ~hole
+        # ensuring barriers are not adjacent to the one above
+
+        # Ensuring barriers are not adjacent to each other along the row:
+        hole[0] = candidate[0]
+        for col in range(1, width):
+            hole[col] = candidate[col] & ~hole[col-1]
+
+        map_data[:, row] = ~hole.T
+
+    if n_maps is None:
+        return map_data[0]
 
     return map_data
 
-def create_traversable_map(height, width, p_tile=0.3):
+def create_traversable_map(height, width, p_tile=0.3, return_waypoints=False,
+                           rng=None, n_maps=None):
     '''Generates a left-to-right traversable map, i.e. a map which contains at
     least one path that crosses the map horizontally.
     The 1s represent traversable tiles and the 0s represent holes.
@@ -68,55 +88,86 @@ def create_traversable_map(height, width, p_tile=0.3):
         Desired map height in pixels.
     p_tile : float, range: [0, 1]
         Probability to replace [non-guaranteed-path] hole with a tile.
+    return_waypoints : bool, optional (default: False)
+        If True, the guaranteed path is returned as well.
+    rng : np.random.Generator or int, optional (default: None)
+        Random generator, or seed to create one: the same seed always gives
+        the same maps.
+    n_maps : int, optional (default: None)
+        If given, a stack of `n_maps` maps is generated at once.
 
     Returns
     -------
-    map_data : np.ndarray, dtype: int
-        A 2D array containing 1s and 0s.
+    map_data : np.ndarray, dtype: uint8
+        A 2D array containing 1s and 0s, or a 3D array of shape
+        (n_maps, height, width) if `n_maps` is given.
+    waypoints : list, or np.ndarray
+        List of [row, col] tiles of the guaranteed path, from the left edge to
+        the right edge, or an array of shape (n_maps, width, 2) if `n_maps` is
+        given. Only returned if `return_waypoints` is True.
     '''
-
-    waypoints = []
-    # list of [x_map, y_map] waypoints of the traversable path
+    rng = np.random.default_rng(rng)
+    n = 1 if n_maps is None else n_maps
 
     # Step 1: Initialize a grid filled with 0s:
-    map_data = np.zeros((height, width), dtype=int)
+    map_data = np.zeros((n, height, width), dtype=np.uint8)
 
     # Step 2: Randomly create a guaranteed path, left to right:
-    row = np.random.choice(range(height))
+    rows = np.empty((n, width), dtype=np.int64)
+    # row of the path, at each column
+    row = rng.integers(0, height, n)
     # randomly initialize path along the left edge
+    steps = rng.integers(-1, 2, (n, width))
+    # move up, down, or stay in the same row
     for col in range(width):
-        # Move up, down, or stay in the same row:
-        row += random.choice([-1, 0, 1])
         # Ensure the path does not go out of the map:
-        row = max(0, min(height - 1, row))
-        # Ensure the path cell is traversable:
-        map_data[row][col] = 1
-        # Store waypoint:
-        waypoints.append([row, col])
+        row = np.clip(row + steps[:, col], 0, height - 1)
+        rows[:, col] = row
 
-    # Step 3: Randomly place some additional traversable tile (1s):
+    # Step 3: Randomly place some additional traversable tile (1s), row by row
+    # to bound the memory taken by random numbers:
     for row in range(height):
-        for col in range(width):
-            if map_data[row][col] == 0 and random.random() < p_tile:
-                map_data[row][col] = 1
+        map_data[:, row] = rng.random((n, width), dtype=np.float32) < p_tile
+
+    # Ensure the path cells are traversable:
+    cols = np.broadcast_to(np.arange(width), (n, width))
+    map_data[np.arange(n)[:, None], rows, cols] = 1
+
+    if n_maps is None:
+        map_data = map_data[0]
+        waypoints = np.stack((rows[0], cols[0]), axis=1).tolist()
+        # list of [row, col] waypoints of the traversable path
+    else:
+        waypoints = np.stack((rows, cols), axis=2)
 
-    # TODO: Return waypoints and use them to get the start and goal
+    if return_waypoints:
+        return map_data, waypoints
 
     return map_data
 
-def write_map_to_file(map_data, path_to_basename):
+def write_map_to_file(map_data, path_to_basename, seed=None):
     '''
-    Writes map data to a text file.
+    Writes map data to a file.
+
+    The format is chosen by the extension of the basename:
+    - '.npz': binary, with the map bit-packed and a header carrying its shape
+      and the seed it was generated from (see `read_map_file`)
+    - '.txt': ASCII digits, one text line per map row
 
     Parameters
     ----------
     map_data : np.ndarray, dtype: int
-        A 2D array containing 1s and 0s.
+        A 2D array containing 1s and 0s, or a 3D stack of such arrays (only
+        for '.npz' files).
 
     path_to_basename : str
         Path to the desired basename of the file: it will be renamed with
-        sequential integers (i.e., ..._0.txt, ..._1.txt, etc.), according to
-        the already existing maps in the target folder.
+        sequential integers (i.e., ..._0.npz, ..._1.npz, etc.), according to
+        the maps already written in the target folder.
+
+    seed : int or array-like, optional (default: None)
+        Seed the map was generated from (one per map, for a stack), stored in
+        the header of '.npz' files. None if unknown.
 
     Returns
     -------
@@ -127,6 +178,17 @@ def write_map_to_file(map_data, path_to_basename):
     # Get a unique filename for the map:
     path_to_map = get_unique_filename(path_to_basename)
 
+    if path_to_map.endswith('.npz'):
+        map_data = np.asarray(map_data)
+        seed = np.asarray(-1 if seed is None else seed, dtype=np.int64)
+        # -1 flags an unknown seed
+
+        # Write to file:
+        np.savez(path_to_map, bits=np.packbits(map_data != 0),
+                 shape=np.array(map_data.shape, dtype=np.int64), seed=seed)
+
+        return path_to_map
+
     # Convert map to text:
     map_data_text = \
         "\n".join("".join(str(cell) for cell in row) for row in map_data)
@@ -136,15 +198,63 @@ def write_map_to_file(map_data, path_to_basename):
         file.write(map_data_text)
 
     return path_to_map
+
+def read_map_file(path_to_map, index=None):
+    '''
+    Reads map data written by `write_map_to_file`, without parsing it cell by
+    cell in Python.
+
+    Parameters
+    ----------
+    path_to_map : str
+        Path to a '.npz' or '.txt' map file.
+    index : int, optional (default: None)
+        For files holding a stack of maps, index of the map to return. If
+        None, the whole stack is returned.
+
+    Returns
+    -------
+    map_data : np.ndarray, dtype: uint8
+        A 2D array containing 1s and 0s (or a 3D stack of them).
+    '''
+    if path_to_map.endswith('.npz'):
+        with np.load(path_to_map) as data:
+            shape = tuple(data['shape'])
+            map_data = np.unpackbits(data['bits'], count=int(np.prod(shape)))
+        map_data = map_data.reshape(shape)
+
+        if index is not None and map_data.ndim == 3:
+            return map_data[index]
+
+        return map_data
+
+    with open(path_to_map, 'rb') as file:
+        text = file.read().replace(b'\r', b'').strip()
+
+    # Digits to values, newlines out:
+    chars = np.frombuffer(text, dtype=np.uint8)
+    width = text.find(b'\n') if b'\n' in text else len(text)
+    map_data = chars[chars != ord('\n')] - ord('0')
+
+    return map_data.reshape(-1, width)
+
+def read_map_seed(path_to_map):
+    '''Returns the seed(s) stored in a '.npz' map file (-1 if unknown).'''
+    with np.load(path_to_map) as data:
+        seed = data['seed']
+
+    return seed if seed.ndim else int(seed)
     
 def get_unique_filename(path_to_basename):
     '''
     Generates a unique filename in the specified directory by appending an
     integer suffix to the base filename.
 
-    The function looks for existing files with the same basename in the target
-    directory, and appends a sequential integer in order to obtain a unique
-    filename.
+    The integer comes from a counter file stored next to the maps (e.g.
+    '.map.counter' for basename 'map.npz'), so that no directory scan is
+    needed. The counter is shared by all extensions with the same basename.
+    If it does not exist yet, it is initialized once from the files already
+    in the directory.
 
     Parameters
     ----------
@@ -161,14 +271,40 @@ def get_unique_filename(path_to_basename):
     filename = os.path.basename(path_to_basename)
 
     root, extension = os.path.splitext(filename)
-    counter = 0
-    unique_filename = f"{root}_{counter}{extension}"
-
-    # Loop to find a unique filename:
-    while os.path.exists(os.path.join(directory, unique_filename)):
-        unique_filename = f"{root}_{counter}{extension}"
+    path_to_counter = os.path.join(directory, '.%s.counter' % root)
+
+    if os.path.exists(path_to_counter):
+        with open(path_to_counter) as file:
+            counter = int(file.read())
+    else:
+        counter = _next_free_index(directory, root)
+
+    # Reserving the name (in the unlikely case it is taken, e.g. by a file
+    # written without the counter, the next one is tried):
+    while True:
+        path_to_unique_filename = \
+            directory + '/' + f"{root}_{counter}{extension}"
         counter += 1
+        try:
+            os.close(os.open(path_to_unique_filename,
+                             os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            continue
 
-    path_to_unique_filename = directory + '/' + unique_filename
+    with open(path_to_counter, 'w') as file:
+        file.write(str(counter))
 
     return path_to_unique_filename
+
+def _next_free_index(directory, root):
+    '''Returns the index following the largest one among the files named
+    `root`_<index>.* in `directory`.'''
+    indices = [-1]
+    for filename in os.listdir(directory):
+        name = os.path.splitext(filename)[0]
+        prefix, _, suffix = name.rpartition('_')
+        if prefix == root and suffix.isdigit():
+            indices.append(int(suffix))
+
+    return max(indices) + 1
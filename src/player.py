@@ -1,16 +1,31 @@
-import pygame
-from pygame.locals import * # keys
-
-import glob
+import os
 import math
 import numpy as np
+from collections import OrderedDict
 
 # src:
 from src.astar import astar
+from src.jps import jps
+from src.flow_field import compute_flow_field
+from src.hpa import HierarchicalPlanner
+from src.dstar_lite import DStarLite
+from src.log import get_logger
+
+log = get_logger('player')
+
+# Movement actions, as unit displacements (dx_map, dy_map):
+ACTIONS = [
+    (0, 0),     # 0: idle
+    (-1, -1),   # 1: up
+    (1, 1),     # 2: down
+    (-1, 1),    # 3: left
+    (1, -1),    # 4: right
+]
 
 class Player:
 
-    def __init__(self, main, spawn_x_map=0, spawn_y_map=0):
+    def __init__(self, main, spawn_x_map=0, spawn_y_map=0, path_cache_size=128,
+                 headless=False):
         self.main = main
         # Current sprite:
         self.x_map = spawn_x_map
@@ -30,43 +45,56 @@ class Player:
         # either of ['idle', 'moving_to']
         self.waypoints = None
         # current waypoints list (only relevant when `status`=='moving_to')
-
-        # Loading all sprites:
-        self.sprites = self.load_sprites_player('data/images/sprites/player')
-
-        # Initializing sprite to the first sprite:
-        self.sprite_name = list(self.sprites.keys())[0]
-        self.sprite      = self.sprites[self.sprite_name]
-        _, _, self.width, self.height = self.sprite.get_rect()
-        # size of the initialized sprite
+        self.path_cache = OrderedDict()
+        self.path_cache_size = path_cache_size
+        # LRU cache of paths, keyed by (map revision, method, start, goal)
+        self.path_stats = {}
+        # 'expanded' nodes and search 'time' of the last search
+        self.planner = None
+        # persistent incremental planner (see `get_planner`)
+
+        self.sprites = {}
+        if not headless:
+        # sprites need a display, hence they are skipped in headless mode
+
+            # Loading all sprites:
+            self.sprites = self.load_sprites_player('data/images/sprites/player')
+
+            # Initializing sprite to the first sprite:
+            self.sprite_name = list(self.sprites.keys())[0]
+            self.sprite      = self.sprites[self.sprite_name]
+            _, _, self.width, self.height = self.sprite.get_rect()
+            # size of the initialized sprite
 
     def load_sprites_player(self, path_sprites_player):
-        sprites = {}
-        # Loading all available sprites and organizign them in a dictionary
-        # indexed by sprite name:
-        for filename in glob.glob(path_sprites_player + '/*.png'):
-            sprite = pygame.image.load(filename).convert()
-            sprite.set_colorkey((0, 0, 0))
+        from src.assets import get_atlas
+        # NOTE: pygame (used by the atlas) is only imported where it is
+        #       needed, so that headless processes (e.g. rollout workers) do
+        #       not pay for it at startup.
 
-            sprite_name = filename.split('/')[-1].split('.')[0]
-            sprites[sprite_name] = sprite
+        # Organizing the sprites of the shared sprite atlas in a dictionary
+        # indexed by sprite name:
+        atlas = get_atlas(os.path.dirname(path_sprites_player))
         
-        return sprites
+        return atlas.get_group(os.path.basename(path_sprites_player))
 
     def move(self, keys, speed=0.1):
+        import pygame
 
         if keys[pygame.K_UP]:
-            self.x_map -= speed
-            self.y_map -= speed
+            self.move_action(1, speed=speed)
         if keys[pygame.K_DOWN]:
-            self.x_map += speed
-            self.y_map += speed
+            self.move_action(2, speed=speed)
         if keys[pygame.K_LEFT]:
-            self.x_map -= speed
-            self.y_map += speed
+            self.move_action(3, speed=speed)
         if keys[pygame.K_RIGHT]:
-            self.x_map += speed
-            self.y_map -= speed
+            self.move_action(4, speed=speed)
+
+    def move_action(self, action, speed=0.1):
+        '''Moves the player by one step along one of the `ACTIONS`.'''
+        dx_map, dy_map = ACTIONS[action]
+        self.x_map += dx_map * speed
+        self.y_map += dy_map * speed
 
     def drop(self, on_tile, speed=0.5):
         if not on_tile:
@@ -92,84 +120,195 @@ class Player:
         # distance from current waypoint
         theta = math.atan2(dy, dx)
 
-        print('\tmove_to:: (x, y): %.2f %.2f --> %.2f %.2f d=%.2f' % \
-                (self.x_map, self.y_map, x_target_map, y_target_map, d))
+        log.debug('\tmove_to:: (x, y): %.2f %.2f --> %.2f %.2f d=%.2f',
+                  self.x_map, self.y_map, x_target_map, y_target_map, d)
+        # NOTE: The message is only formatted if debug messages are enabled.
 
         if d > speed:
         # NOTE: `d` and `speed` have the same units of space, here, because
         #        the speed is implictly multiplied by the clock tick.
-            print('\tmove_to:: Taking a step')
+            log.debug('\tmove_to:: Taking a step')
             self.x_map += speed * math.cos(theta)
             self.y_map += speed * math.sin(theta)
             self.moving_status = 'moving_to'
         else:
-            print('\tmove_to:: Target reached')
+            log.debug('\tmove_to:: Target reached')
             # Centering exactly on target:
             self.x_map = x_target_map
             self.y_map = y_target_map
             self.moving_status = 'target_reached'
 
+    def get_planner(self, goal, map_data=None):
+        '''Returns the persistent `DStarLite` planner towards `goal`
+        (x_map, y_map), creating it only when the goal or the map change.
+
+        On the world's map, the planner follows the map's changes by itself.
+        '''
+        world = self.main.world
+        if map_data is None: map_data = world.map_data
+        goal = (int(goal[0]), int(goal[1]))
+
+        if (self.planner is None or self.planner.goal != goal
+                or self.planner.map_data is not map_data):
+            if self.planner is not None:
+                self.planner.detach()
+            self.planner = DStarLite(
+                map_data, goal,
+                world=world if map_data is world.map_data else None)
+
+        return self.planner
+
     def find_path(self, x_target_map, y_target_map,
                   map_data=None, method='AStar'):                  
         '''Seeks for a valid path from the current player position to the
         target position, via a list of waypoints.
 
-        For AStar to work, the current position and the target position are
-        approximated to the closest integer (i.e., tile center)
+        The current position and the target position are approximated to the
+        closest integer (i.e., tile center).
         
         Parameters
         ----------
         x_target_map, y_target_map : float
             Target coordinates in map reference.
-            If method is 'AStar', the input coordinates get rounded to the
-            closest integer (the algorithm works exclusively with integers).
+            The input coordinates get rounded to the closest integer (the
+            algorithms work exclusively with integers).
         map_data : list of lists
             Map data in numerical form (0 = no tile).
         method : str (default is 'AStar')
-            Path-finding method.
-            Placeholder for future alternatives.          
+            Path-finding method:
+            - 'AStar': `astar` search, cached per map revision, start and goal
+            - 'FlowField': walk down the goal's flow field, which is computed
+              once per map revision and goal, and shared by all the agents
+            - 'JPS': `jps` (Jump Point Search), cached as 'AStar'. Expanded
+              nodes and runtime of the last search go to `path_stats`
+            - 'HPA': hierarchical search (see `HierarchicalPlanner`) on the
+              world's planner, cached as 'AStar'. Paths a few percent longer
+              than 'AStar's at most on long queries, meant for very large
+              maps
+            - 'DStarLite': incremental search (see `DStarLite`) on the
+              persistent planner of `get_planner`, which repairs its previous
+              search after the player moves or the map changes
 
         Returns
         -------
-        waypoints : list, optional (default: [[0, 0]])
+        waypoints : list, or None
             List of tuples [x_map, y_map], where each tuple is an intermediate
-            target to go through.
+            target to go through, or None if the target tile is empty or not
+            reachable. On the world's map, unreachable targets are rejected
+            in O(1) (see `World.is_reachable`), without any search.
         '''
-        if method == 'AStar':
-        
-            # Round target coords to closest tile center:
-            x_target_map = int(x_target_map)
-            y_target_map = int(y_target_map)
-
-            # Check that target tile is not empty, or else AStar gets stuck:
-            map_value = map_data[y_target_map][x_target_map]
-            if map_value == 0:
-                print('find_path:: Target tyle is empty')
+        world = self.main.world
+        if map_data is None: map_data = world.map_data
+
+        # Round target coords to closest tile center:
+        x_target_map = int(x_target_map)
+        y_target_map = int(y_target_map)
+
+        # Check that target tile is not empty, or else AStar gets stuck:
+        map_value = map_data[y_target_map][x_target_map]
+        if map_value == 0:
+            log.info('find_path:: Target tyle is empty')
+            self.status = 'idle'
+            return None
+
+        start = (int(self.x_map), int(self.y_map))
+        goal  = (x_target_map, y_target_map)
+        log.debug('\tfind_path:: start %s | goal %s', start, goal)
+
+        # Check that start and target are in the same island, or else the
+        # search explores all the start's island before giving up:
+        if map_data is world.map_data and not world.is_reachable(start, goal):
+            log.info('find_path:: Target tyle is unreachable')
+            self.status = 'idle'
+            return None
+
+        if method == 'FlowField':
+
+            if map_data is world.map_data:
+                flow_field = world.get_flow_field(goal)
+                # shared with any other agent heading to the same goal
+            else:
+                flow_field = compute_flow_field(map_data, goal)
+
+            path = flow_field.path_from(*start)
+            if path is None:
+                log.info('find_path:: Target tyle is unreachable')
                 self.status = 'idle'
-                return 1
+                return None
 
-            # Inverting map values, to conform AStar's expected input:
-            map_astar = np.array(map_data, dtype=np.uint8).T
-            # map's x and y get switched in numpy, hence the transpose
-            map_astar = 1 - map_astar
+        if method == 'DStarLite':
 
-            start = (int(self.x_map), int(self.y_map))
-            goal  = (x_target_map, y_target_map)
-            # debug:
-            #print('\tfind_path:: start %s | goal %s' % (start, goal))
-            
-            path = astar(map_astar, start, goal)[1:]
-            # NOTE: The first element in the path is dropped, as it is the
-            #       starting position.
+            planner = self.get_planner(goal, map_data=map_data)
+            planner.update_start(start)
+            path = planner.extract_path(stats=self.path_stats)
+            if path is None:
+                log.info('find_path:: Target tyle is unreachable')
+                self.status = 'idle'
+                return None
+            path = [list(tup) for tup in path[1:]]
+
+        if method in ('AStar', 'JPS', 'HPA'):
+
+            search = astar if method == 'AStar' else jps
+            # both work on the same input and return the same path format
+
+            use_cache = map_data is world.map_data
+            # paths are cached only for the world's map, whose changes are
+            # tracked by its revision counter
+            key = (world.map_revision, method, start, goal)
+
+            if use_cache and key in self.path_cache:
+                self.path_cache.move_to_end(key)
+                path = self.path_cache[key]
+
+            else:
+                if method == 'HPA':
+                    if use_cache:
+                        planner = world.get_hpa_planner()
+                        # built once, and updated as the map's tiles change
+                    else:
+                        planner = HierarchicalPlanner(map_data)
+
+                    path = planner.find_path(start, goal,
+                                             stats=self.path_stats)
+
+                else:
+                    if use_cache:
+                        map_astar = world.get_map_astar()
+                    else:
+                        # Inverting map values, to conform AStar's input:
+                        map_astar = 1 - np.array(map_data, dtype=np.uint8).T
+                        # map's x and y get switched in numpy, hence the
+                        # transpose
+
+                    path = search(map_astar, start, goal,
+                                  stats=self.path_stats)
+
+                if path is not None:
+                    path = path[1:]
+                    # NOTE: The first element in the path is dropped, as it
+                    #       is the starting position.
+
+                if use_cache:
+                    self.path_cache[key] = path
+                    if len(self.path_cache) > self.path_cache_size:
+                        self.path_cache.popitem(last=False)
+                        # evicting the least recently used path
+
+            if path is None:
+                log.info('find_path:: Target tyle is unreachable')
+                self.status = 'idle'
+                return None
 
             # Convert each tuple to a list:
             path = [list(tup) for tup in path]
-            # debug:
-            #print('\tfind_path:: path\n\t\t%s' % path)
+            # NOTE: Fresh lists are returned, as `move_through` consumes them.
+            log.debug('\tfind_path:: path\n\t\t%s', path)
 
         return path
 
-    def move_through(self, events, waypoints=[[0, 0]], speed=0.1):
+    def move_through(self, events, waypoints=[[0, 0]], speed=0.1,
+                     planner=None):
         '''Moves the player through a list of waypoints.
 
         For AStar to work, the current position and the target position are
@@ -184,17 +323,47 @@ class Player:
             target to go through.
         speed : float
             Cruising speed.
+        planner : DStarLite, optional (default: None)
+            If given, it is consulted at every call, and the waypoints past
+            the current one are replaced by its repaired path (`waypoints` is
+            then ignored).
         '''
 
         # Checking wether to initiate a "move to":
+        if events:
+            from pygame.locals import KEYDOWN, K_RETURN
         for event in events:
             if event.type == KEYDOWN:
                 if event.key == K_RETURN:
-                    print('move_to:: Initiating movement')
+                    log.info('move_to:: Initiating movement')
                     self.status = 'moving_through'
 
         if self.status == 'moving_through':
             
+            if planner is not None:
+                # Repairing the path from the current waypoint, or from the
+                # player's tile before the first one:
+                if self.waypoints:
+                    planner.update_start(self.waypoints[0])
+                else:
+                    planner.update_start((int(self.x_map), int(self.y_map)))
+                path = planner.extract_path(stats=self.path_stats)
+
+                if path is None:
+                    log.info('move_through:: Target tyle is unreachable')
+                    self.status = 'idle'
+                    return 1
+                path = [list(tup) for tup in path[1:]]
+
+                if self.waypoints:
+                    self.waypoints[1:] = path
+                elif path:
+                    self.waypoints = path
+                else:
+                    log.info('move_through:: Terminating movement')
+                    self.status = 'idle'
+                    return 0
+
             # Initialize waypoints, if none is set:
             if self.waypoints is None: 
                 self.waypoints = waypoints
@@ -210,11 +379,11 @@ class Player:
                 self.waypoints.pop(0)
 
                 if self.waypoints:
-                    print('move_through:: Next waypoint: %s' %\
-                          self.waypoints[0])
+                    log.debug('move_through:: Next waypoint: %s',
+                              self.waypoints[0])
 
                 else:
-                    print('move_through:: Terminating movement')
+                    log.info('move_through:: Terminating movement')
                     self.status = 'idle'
                     return 0
 
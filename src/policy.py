@@ -0,0 +1,223 @@
+'''
+Batched policies, driving a crowd of agents (see `Agents`) with one model call
+per tick.
+
+At every tick, the observations of all the agents are extracted at once with
+vectorized NumPy ops, stacked into a batch, and passed to the model in a
+single call; the actions it returns are scattered back to the agents. A model
+is any callable taking a batch of observations (see `extract_observations`)
+and returning an action index (in `player.ACTIONS`) per agent, e.g. a wrapper
+around a neural network:
+
+    policy = BatchedPolicy(lambda obs: net(obs['map'], obs['goal']).argmax(1))
+    sim = Simulation(n_agents=1000, policy=policy)
+
+With `threaded=True`, the actions of the next tick are inferred in a worker
+thread, from the state at the end of the current tick, while the caller goes
+on (e.g. rendering the frame).
+'''
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# src:
+from src.player import ACTIONS
+
+
+def extract_observations(map_data, x_map, y_map, goal, radius=5):
+    '''Builds the observations of many agents at once.
+
+    Parameters
+    ----------
+    map_data : array-like, shape (height, width)
+        Map data in numerical form (0 = no tile), indexed as [y_map][x_map].
+    x_map, y_map : np.ndarray, shape (n_agents,)
+        Positions in map coordinates.
+    goal : array-like, shape (2,) or (n_agents, 2)
+        Goal tile (x_map, y_map), shared or one per agent.
+    radius : int, optional (default: 5)
+        Half side of the map crop around each agent, in tiles.
+
+    Returns
+    -------
+    observations : dict
+        'map' : np.ndarray, shape (n_agents, 2*radius+1, 2*radius+1),
+            dtype: uint8. Tiles around each agent (1 = tile), centered on
+            its tile and indexed as [y_map][x_map]; out of the map is 0.
+        'offset' : np.ndarray, shape (n_agents, 2), dtype: float32. Position
+            w/r to the center of the agent's tile, as [x_map, y_map].
+        'goal' : np.ndarray, shape (n_agents, 2), dtype: float32. Goal w/r to
+            the agent, as [x_map, y_map].
+    '''
+    map_data = np.asarray(map_data)
+    side = 2*radius + 1
+
+    x_tile = np.floor(x_map + 0.5).astype(np.int64)
+    y_tile = np.floor(y_map + 0.5).astype(np.int64)
+    # NOTE: Tile e.g. (0, 0) ranges between -0.5 and 0.5 in both axes.
+
+    # Crops, as windows of a padded map (clipped for agents far off the map,
+    # which only see holes anyway):
+    padded = np.pad(map_data != 0, side).astype(np.uint8)
+    height, width = padded.shape
+    x_tile = np.clip(x_tile + radius + 1, 0, width - side)
+    y_tile = np.clip(y_tile + radius + 1, 0, height - side)
+    # top-left corners of the windows, in the padded map
+    windows = np.lib.stride_tricks.sliding_window_view(padded, (side, side))
+    crops = windows[y_tile, x_tile]
+    # NOTE: Fancy indexing copies the windows into a contiguous batch.
+
+    position = np.stack((x_map, y_map), axis=1)
+
+    return {
+        'map': crops,
+        'offset': (position - np.floor(position + 0.5)).astype(np.float32),
+        'goal': (np.asarray(goal) - position).astype(np.float32),
+    }
+
+
+def greedy_policy(observations, speed=0.1):
+    '''Reference model: steps towards the goal, along the action closest to
+    its direction that keeps the agent on a tile (idle when no action does).
+
+    Parameters
+    ----------
+    observations : dict
+        Batch of observations, as returned by `extract_observations`.
+    speed : float, optional (default: 0.1)
+        Step of the agents, as in `Agents.move`.
+
+    Returns
+    -------
+    actions : np.ndarray, shape (n_agents,), dtype: int
+    '''
+    crops, goal = observations['map'], observations['goal']
+    radius = crops.shape[1] // 2
+    actions = np.array(ACTIONS[1:])
+    # moving actions, as (dx_map, dy_map)
+
+    scores = goal @ (actions / np.linalg.norm(actions, axis=1)[:, None]).T
+    # (n_agents, n_moving_actions)
+
+    # Tiles the agents would be on after each action, w/r to their tile, as
+    # flat indices in the crops:
+    side = crops.shape[1]
+    position = observations['offset'][:, None, :] + \
+        (actions * speed + 0.5).astype(np.float32)
+    x_tiles = [np.floor(position[:, :, 0] + margin).astype(np.int64)
+               for margin in (-1e-3, 1e-3)]
+    y_tiles = [np.floor(position[:, :, 1] + margin).astype(np.int64)
+               for margin in (-1e-3, 1e-3)]
+    origin = (np.arange(len(crops)) * side * side +
+              radius * (side + 1))[:, None]
+
+    walkable = np.ones(scores.shape, dtype=bool)
+    for x_tile in x_tiles:
+        for y_tile in y_tiles:
+            walkable &= crops.ravel()[origin + y_tile * side + x_tile] != 0
+    # NOTE: Steps ending on a tile border (up to float rounding, as with
+    #       diagonal steps across corners) need both sides to be tiles.
+    scores = np.where(walkable, scores, -np.inf)
+
+    best = np.argmax(scores, axis=1) + 1
+    idle = ~np.isfinite(scores.max(axis=1)) | \
+        (np.abs(goal).max(axis=1) < 0.5)
+    # no tile to go to, or already on the goal's tile
+
+    return np.where(idle, 0, best)
+
+
+class BatchedPolicy:
+    '''
+    Drives agents with a model called once per tick on all of them.
+
+    Only agents that are not falling are observed and acted upon: the others
+    get the idle action.
+
+    Parameters
+    ----------
+    model : callable
+        Takes a batch of observations (see `extract_observations`), and
+        returns an action index per observation.
+    radius : int, optional (default: 5)
+        Half side of the observed map crops, in tiles.
+    threaded : bool, optional (default: False)
+        If True, `prefetch` runs the model in a worker thread, so that the
+        actions of the next tick are inferred while the caller goes on (e.g.
+        rendering the frame).
+    '''
+    def __init__(self, model, radius=5, threaded=False):
+        self.model = model
+        self.radius = radius
+        self.threaded = threaded
+
+        self.executor = ThreadPoolExecutor(max_workers=1) if threaded \
+                        else None
+        self.future = None
+        self.future_key = None
+        # batch being inferred by the worker thread, if any, and the key of
+        # the state it was observed in
+
+    def _observe(self, agents, goal):
+        '''Returns the agents not falling, and their observations.'''
+        agents_index = np.flatnonzero(agents.z_map >= 0)
+        goal = np.asarray(goal)
+        observations = extract_observations(
+            agents.world.map_data, agents.x_map[agents_index],
+            agents.y_map[agents_index],
+            goal[agents_index] if goal.ndim == 2 else goal,
+            radius=self.radius)
+
+        return agents_index, observations, agents.n_agents
+
+    def _infer(self, agents_index, observations, n_agents):
+        '''Calls the model, and scatters its actions to all the agents.'''
+        actions = np.zeros(n_agents, dtype=np.int64)
+        # idle, by default
+        if len(agents_index) > 0:
+            actions[agents_index] = np.asarray(self.model(observations),
+                                               dtype=np.int64)
+
+        return actions
+
+    def act(self, agents, goal, key=None):
+        '''Returns the action of each agent (see `Agents.step`).
+
+        The actions prefetched with the same `key` are used if any, and
+        inferred right away otherwise.
+
+        Parameters
+        ----------
+        agents : Agents
+            Agents to be driven, on their world's map.
+        goal : array-like, shape (2,) or (n_agents, 2)
+            Goal tile (x_map, y_map), shared or one per agent.
+        key : hashable, optional (default: None)
+            Identifies the current state of the agents (e.g. the tick).
+        '''
+        if self.future is not None:
+            future, self.future = self.future, None
+            if self.future_key == key:
+                return future.result()
+            future.cancel()
+            # observed in another state
+
+        return self._infer(*self._observe(agents, goal))
+
+    def prefetch(self, agents, goal, key=None):
+        '''Starts inferring the actions of the agents in their current state
+        in the worker thread, to be returned by the next `act` with the same
+        `key` (threaded policies only).'''
+        if not self.threaded:
+            return
+
+        self.future_key = key
+        self.future = self.executor.submit(self._infer,
+                                           *self._observe(agents, goal))
+        # NOTE: The observations are extracted here: the worker only sees
+        #       their copy, not the agents.
+
+    def close(self):
+        '''Stops the worker thread, if any.'''
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.future = None
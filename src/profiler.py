@@ -0,0 +1,154 @@
+import pygame
+
+import time
+import numpy as np
+
+class FrameProfiler:
+    '''
+    Per-phase frame timings, kept in a ring buffer of the last frames.
+
+    A frame is opened by `start_frame`, split into phases by `lap`, and closed
+    by `end_frame`:
+
+        profiler.start_frame()
+        handle_events(); profiler.lap('events')
+        update();        profiler.lap('update')
+        draw();          profiler.lap('draw')
+        profiler.end_frame()
+
+    When disabled, every call returns straight away, so that the
+    instrumentation can be left in the loop at no cost.
+
+    Parameters
+    ----------
+    phases : tuple of str
+        Names of the phases of a frame, in order.
+    capacity : int, optional (default: 600)
+        Number of frames kept (10 s at 60 fps).
+    enabled : bool, optional (default: False)
+        Whether frames are recorded.
+    '''
+    def __init__(self, phases, capacity=600, enabled=False):
+        self.phases = tuple(phases)
+        self.columns = {phase: i for i, phase in enumerate(self.phases)}
+        # column of each phase in the buffer
+
+        self.times = np.zeros((capacity, len(self.phases)))
+        # seconds spent in each phase, one row per frame
+        self.capacity = capacity
+        self.n_frames = 0
+        # frames recorded so far (the latest ones are kept)
+
+        self.enabled = enabled
+        self._row = np.zeros(len(self.phases))
+        self._time_last = 0.
+
+    def toggle(self):
+        '''Switches recording on and off (recorded frames are kept).'''
+        self.enabled = not self.enabled
+        self.start_frame()
+        # NOTE: Toggling happens mid-frame: the current frame is recorded
+        #       from now on.
+
+    def start_frame(self):
+        if not self.enabled: return
+        self._row[:] = 0.
+        self._time_last = time.perf_counter()
+
+    def lap(self, phase):
+        '''Closes `phase`: the time since the last call goes to it.'''
+        if not self.enabled: return
+        time_now = time.perf_counter()
+        self._row[self.columns[phase]] += time_now - self._time_last
+        self._time_last = time_now
+
+    def end_frame(self):
+        if not self.enabled: return
+        self.times[self.n_frames % self.capacity] = self._row
+        self.n_frames += 1
+
+    def get_times(self):
+        '''Returns the recorded frames, oldest first, as a
+        (n_frames, n_phases) array of seconds.'''
+        if self.n_frames <= self.capacity:
+            return self.times[:self.n_frames]
+
+        # Unrolling the ring buffer:
+        i = self.n_frames % self.capacity
+        return np.concatenate((self.times[i:], self.times[:i]))
+
+    def percentiles(self, q=(50, 99)):
+        '''Returns {phase: [percentiles]} of the recorded frames, in ms, plus
+        the whole frame as 'total'.'''
+        times = self.get_times()
+        if len(times) == 0:
+            return {}
+        times = np.column_stack((times, times.sum(axis=1))) * 1e3
+        values = np.percentile(times, q, axis=0)
+
+        return {phase: values[:, i].tolist()
+                for i, phase in enumerate(self.phases + ('total',))}
+
+    def dump_csv(self, path_to_csv):
+        '''Writes the recorded frames to a CSV file, one row per frame, with
+        the time of each phase in ms.'''
+        times = self.get_times()
+        first = self.n_frames - len(times)
+        # index of the oldest frame kept
+        frames = np.arange(first, self.n_frames)
+
+        np.savetxt(path_to_csv,
+                   np.column_stack((frames, times * 1e3)),
+                   fmt=['%d'] + ['%.4f'] * len(self.phases), delimiter=',',
+                   header=','.join(('frame',) + self.phases), comments='')
+
+
+class ProfilerOverlay:
+    '''
+    Shows the p50 and p99 frame times of a `FrameProfiler`, per phase, in a
+    panel next to the commands list.
+
+    The text is re-rendered only every `refresh` frames, to keep the overlay's
+    own cost out of the measurements.
+    '''
+    def __init__(self, screen, profiler, refresh=30):
+        self.surface = screen
+        self.profiler = profiler
+        self.refresh = refresh
+        self.font = pygame.font.SysFont('monospace', 16)
+        # fixed width, to align the columns
+        self.x = int(0.3 * screen.get_width()) + 10
+        # right of the commands list panel (see `CommandsList.draw`)
+        self.y = 10
+        self.panel_color = (50, 50, 50)
+        self.text_color = (255, 255, 255)
+
+        self._panel = None
+        self._frames_rendered = -refresh
+
+    def _render(self):
+        lines = ['%-12s %7s %7s' % ('PROFILE (ms)', 'p50', 'p99')]
+        for phase, (p50, p99) in self.profiler.percentiles().items():
+            lines.append('%-12s %7.2f %7.2f' % (phase, p50, p99))
+        lines.append('%d frames' % min(self.profiler.n_frames,
+                                       self.profiler.capacity))
+
+        texts = [self.font.render(line, True, self.text_color)
+                 for line in lines]
+        width = max(text.get_width() for text in texts) + 20
+        panel = pygame.Surface((width, 20 * len(texts) + 10))
+        panel.fill(self.panel_color)
+        for index, text in enumerate(texts):
+            panel.blit(text, (10, 5 + index * 20))
+
+        return panel
+
+    def draw(self):
+        if not self.profiler.enabled:
+            return
+
+        if self.profiler.n_frames - self._frames_rendered >= self.refresh:
+            self._panel = self._render()
+            self._frames_rendered = self.profiler.n_frames
+
+        self.surface.blit(self._panel, (self.x, self.y))
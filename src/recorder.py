@@ -0,0 +1,276 @@
+'''
+Recording of episodes (per-tick state of the player and of the agents), and
+their replay.
+
+A `Recorder` appends one record per agent per tick to a preallocated buffer,
+which is flushed to the episode file only when full, so that recording costs
+no I/O per tick. An episode file is a header followed by blocks, each with a
+kind and a length:
+
+    magic             b'WALKEP01'
+    block             kind (uint8), length in bytes (uint32), payload
+      'map'           map id (uint32), height, width (uint16), bit-packed map
+      'records'       records, as `RECORD_DTYPE`
+
+Maps are written once, when first seen, and referenced by their id in the
+records. An episode is read back with `read_episode`, and `Replay` plays it
+back into a `Simulation`, without stepping it (hence without physics nor path
+finding), e.g. to render it with `main.Game`.
+'''
+import os
+import struct
+import numpy as np
+
+# src:
+from src.agents import Agents, STATUSES
+from src.map_generators import get_unique_filename
+
+# Episode record (fixed size, little endian):
+RECORD_DTYPE = np.dtype([('tick', '<u4'), ('agent', '<u4'),
+                         ('x_map', '<f4'), ('y_map', '<f4'), ('z_map', '<f4'),
+                         ('status', 'u1'), ('action', 'u1'),
+                         ('map_id', '<u2')])
+NO_ACTION = 255
+# action of the agents not driven by an action index
+EPISODE_MAGIC = b'WALKEP01'
+BLOCK_MAP, BLOCK_RECORDS = 0, 1
+BLOCK_HEADER = struct.Struct('<BI')
+MAP_HEADER = struct.Struct('<IHH')
+
+
+class Recorder:
+    '''
+    Records episodes to binary files, one per episode (see the module's
+    docstring for the format).
+
+    Agent 0 is the player, and agents 1 to N the agents of a crowd.
+
+    Parameters
+    ----------
+    path_episodes : str
+        Folder of the episode files, named 'episode_<n>.bin'.
+    buffer_size : int, optional (default: 65536)
+        Number of records buffered between writes.
+    '''
+    def __init__(self, path_episodes, buffer_size=65536):
+        self.path_episodes = path_episodes
+        if not os.path.exists(path_episodes): os.makedirs(path_episodes)
+
+        self.buffer = np.zeros(buffer_size, dtype=RECORD_DTYPE)
+        self.n_buffered = 0
+
+        self.file = None
+        self.path_to_episode = None
+        # current episode, if any
+        self.map_ids = {}
+        # id of each map written to the current episode, by map revision
+
+    def begin_episode(self):
+        '''Opens a new episode file (closing the current one, if any), and
+        returns its path.'''
+        self.end_episode()
+
+        self.path_to_episode = get_unique_filename(
+            os.path.join(self.path_episodes, 'episode.bin'))
+        self.file = open(self.path_to_episode, 'wb')
+        self.file.write(EPISODE_MAGIC)
+        self.map_ids = {}
+
+        return self.path_to_episode
+
+    def get_map_id(self, world):
+        '''Returns the id of the world's current map in this episode, writing
+        the map to the file the first time it is seen.'''
+        if world.map_revision not in self.map_ids:
+            map_id = len(self.map_ids)
+            self.map_ids[world.map_revision] = map_id
+
+            map_data = np.asarray(world.map_data)
+            bits = np.packbits(map_data != 0).tobytes()
+            self.file.write(BLOCK_HEADER.pack(BLOCK_MAP,
+                                              MAP_HEADER.size + len(bits)))
+            self.file.write(MAP_HEADER.pack(map_id, *map_data.shape))
+            self.file.write(bits)
+
+        return self.map_ids[world.map_revision]
+
+    def record(self, tick, agent, x_map, y_map, z_map, status,
+               action=NO_ACTION, map_id=0):
+        '''Records the state of one agent, or of many at once (arrays of the
+        same length, or scalars shared by all of them).
+
+        `status` is an index in `agents.STATUSES`, and `action` an index in
+        `player.ACTIONS`, or `NO_ACTION`.
+        '''
+        agent = np.atleast_1d(agent)
+        n_records = len(agent)
+        if self.n_buffered + n_records > len(self.buffer):
+            self.flush()
+
+        if n_records > len(self.buffer):
+        # larger than the whole buffer: written straight away
+            records = np.zeros(n_records, dtype=RECORD_DTYPE)
+        else:
+            records = self.buffer[self.n_buffered:self.n_buffered + n_records]
+            self.n_buffered += n_records
+
+        records['tick'] = tick
+        records['agent'] = agent
+        records['x_map'] = x_map
+        records['y_map'] = y_map
+        records['z_map'] = z_map
+        records['status'] = status
+        records['action'] = action
+        records['map_id'] = map_id
+
+        if n_records > len(self.buffer):
+            self._write_records(records)
+
+    def _write_records(self, records):
+        self.file.write(BLOCK_HEADER.pack(BLOCK_RECORDS, records.nbytes))
+        self.file.write(records.tobytes())
+
+    def flush(self):
+        if self.n_buffered > 0:
+            self._write_records(self.buffer[:self.n_buffered])
+            self.n_buffered = 0
+        self.file.flush()
+
+    def end_episode(self):
+        '''Flushes and closes the current episode, if any.'''
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def close(self):
+        self.end_episode()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_episode(path_to_episode):
+    '''Reads a file written by `Recorder`.
+
+    Returns
+    -------
+    records : np.ndarray, dtype: RECORD_DTYPE
+        Records, sorted by tick and agent.
+    maps : dict
+        Maps of the episode, as {map id: np.ndarray (height, width)}.
+    '''
+    with open(path_to_episode, 'rb') as file:
+        data = file.read()
+    if not data.startswith(EPISODE_MAGIC):
+        raise ValueError('read_episode:: %s is not an episode file' %
+                         path_to_episode)
+
+    records, maps = [], {}
+    position = len(EPISODE_MAGIC)
+    while position < len(data):
+        kind, length = BLOCK_HEADER.unpack_from(data, position)
+        position += BLOCK_HEADER.size
+        payload = memoryview(data)[position:position + length]
+        position += length
+
+        if kind == BLOCK_MAP:
+            map_id, height, width = MAP_HEADER.unpack_from(payload)
+            bits = np.frombuffer(payload[MAP_HEADER.size:], dtype=np.uint8)
+            maps[map_id] = np.unpackbits(bits, count=height * width)\
+                             .reshape(height, width)
+        elif kind == BLOCK_RECORDS:
+            records.append(np.frombuffer(payload, dtype=RECORD_DTYPE))
+
+    records = np.concatenate(records) if records else \
+        np.zeros(0, dtype=RECORD_DTYPE)
+
+    return records[np.lexsort((records['agent'], records['tick']))], maps
+
+
+class Replay:
+    '''
+    Plays a recorded episode back into a simulation, one tick per `step`.
+
+    The recorded state is copied into the simulation's player, agents and map,
+    which are never stepped: positions are those recorded, and interpolation
+    between ticks works as for a running simulation.
+
+    Parameters
+    ----------
+    path_to_episode : str
+        Episode file, as written by `Recorder`.
+    '''
+    def __init__(self, path_to_episode):
+        self.path_to_episode = path_to_episode
+        self.records, self.maps = read_episode(path_to_episode)
+
+        self.ticks, self.starts = np.unique(self.records['tick'],
+                                            return_index=True)
+        self.ends = np.append(self.starts[1:], len(self.records))
+        # records of each tick
+        self.index = -1
+        # index of the last tick played, in `ticks`
+        self.map_id = None
+        # id of the map set in the simulation
+
+    @property
+    def done(self):
+        return self.index >= len(self.ticks) - 1
+
+    def step(self, sim):
+        '''Copies the next tick's state into `sim`, and returns False once the
+        episode is over (the last tick then stays in place).'''
+        if self.done:
+            sim.player_previous = (sim.player.x_map, sim.player.y_map,
+                                   sim.player.z_map)
+            if sim.agents is not None:
+                sim.agents.x_previous[:] = sim.agents.x_map
+                sim.agents.y_previous[:] = sim.agents.y_map
+            return False
+
+        self.index += 1
+        records = self.records[self.starts[self.index]:self.ends[self.index]]
+
+        map_id = int(records['map_id'][0])
+        if map_id != self.map_id:
+            sim.world.set_map(self.maps[map_id].copy())
+            self.map_id = map_id
+
+        # Player (agent 0):
+        player = sim.player
+        sim.player_previous = (player.x_map, player.y_map, player.z_map)
+        if records['agent'][0] == 0:
+            player.x_map, player.y_map, player.z_map = \
+                records[['x_map', 'y_map', 'z_map']][0].tolist()
+            player.status = STATUSES[records['status'][0]]
+            records = records[1:]
+
+        # Agents (1 to N):
+        if len(records) > 0:
+            n_agents = int(records['agent'][-1])
+            if sim.agents is None or sim.agents.n_agents != n_agents:
+                sim.agents = Agents(sim.world, n_agents)
+                new = True
+            else:
+                new = False
+            agents = sim.agents
+            index = records['agent'].astype(np.int64) - 1
+
+            agents.x_previous[:] = agents.x_map
+            agents.y_previous[:] = agents.y_map
+            agents.x_map[index] = records['x_map']
+            agents.y_map[index] = records['y_map']
+            agents.z_map[index] = records['z_map']
+            agents.status[index] = records['status']
+            if new:
+                agents.x_previous[:] = agents.x_map
+                agents.y_previous[:] = agents.y_map
+                # no motion to interpolate on the first tick
+
+        sim.tick = int(self.ticks[self.index])
+
+        return True
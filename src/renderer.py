@@ -0,0 +1,355 @@
+import pygame
+
+import numpy as np
+from collections import OrderedDict
+
+# src:
+from src.utils import coords_map_to_screen
+
+COLORKEY = (0, 0, 0)
+# transparent color of the sprites, chunks and minimap
+
+
+class Camera:
+    '''
+    Viewport over the isometric map, following a target (e.g. the player).
+
+    Positions are in map pixels, i.e. screen coordinates of the map drawn with
+    no offset (see `coords_map_to_screen`): the camera holds the map pixel
+    shown at the top-left corner of the viewport.
+
+    Parameters
+    ----------
+    size : tuple
+        Size of the viewport, in pixels.
+    offset_x, offset_y : int, optional (default: None)
+        Offset of the map w/r to the viewport along the axes where the whole
+        map fits in the viewport (the camera then stays still along them). If
+        None, the map is centered.
+    smoothing : float, optional (default: 0.2)
+        Fraction of the distance to the target covered at each `follow`
+        (1 = the camera snaps to the target).
+    '''
+    def __init__(self, size, offset_x=None, offset_y=None, smoothing=0.2):
+        self.width, self.height = size
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+        self.smoothing = smoothing
+
+        self.x, self.y = None, None
+        # top-left corner of the viewport, in map pixels (set on first follow)
+
+    def follow(self, x, y, bounds):
+        '''Moves the camera towards centering (x, y), in map pixels.
+
+        Parameters
+        ----------
+        x, y : float
+            Target, in map pixels.
+        bounds : tuple
+            (left, top, right, bottom) of the map, in map pixels (see
+            `MapRenderer.get_bounds`): the viewport is kept within them.
+        '''
+        left, top, right, bottom = bounds
+
+        x_target = self._clamp(x - self.width/2, left, right, self.width,
+                               self.offset_x)
+        y_target = self._clamp(y - self.height/2, top, bottom, self.height,
+                               self.offset_y)
+
+        if self.x is None:
+            self.x, self.y = x_target, y_target
+        else:
+            self.x += self.smoothing * (x_target - self.x)
+            self.y += self.smoothing * (y_target - self.y)
+
+    @staticmethod
+    def _clamp(position, low, high, size, offset):
+        if high - low <= size:
+        # the map fits along this axis
+            if offset is None:
+                return (low + high - size) / 2
+            return -offset
+
+        return min(max(position, low), high - size)
+
+    def get_offset(self):
+        '''Returns the offset of the map w/r to the viewport, as expected by
+        `coords_map_to_screen`.'''
+        return -round(self.x), -round(self.y)
+        # NOTE: Rounded, so that chunks and sprites move by whole pixels
+        #       together.
+
+
+class MapRenderer:
+    '''
+    Draws the map tiles visible in a camera's viewport, and the minimap.
+
+    The map is split into square chunks of tiles, each pre-rendered to its own
+    surface the first time it is seen, and kept in an LRU cache. A frame only
+    blits the few chunks overlapping the viewport, so that its cost depends on
+    the screen size, not on the map size.
+
+    The renderer listens to the world's map (see `World.add_map_listener`):
+    changed tiles only invalidate their chunk, while a new map clears the
+    cache.
+
+    Parameters
+    ----------
+    world : World
+        World whose map is rendered (with sprites loaded).
+    chunk_size : int, optional (default: 16)
+        Side of the chunks, in tiles.
+    max_chunks : int, optional (default: 64)
+        Number of chunks kept in the cache.
+    box_dx_mini, box_dy_mini : int, optional (default: 7)
+        Minimap box sizes, in pixels, shrunk for the minimap of large maps
+        to fit `size_mini`.
+    size_mini : int, optional (default: 105)
+        Largest side of the minimap, in pixels.
+    background : tuple
+        Background color.
+    '''
+    def __init__(self, world, chunk_size=16, max_chunks=64, box_dx_mini=7,
+                 box_dy_mini=7, size_mini=105, background=(35, 35, 35)):
+        self.world = world
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.box_dx_mini_max = box_dx_mini
+        self.box_dy_mini_max = box_dy_mini
+        self.size_mini = size_mini
+        self.background = background
+
+        self.chunks = OrderedDict()
+        # LRU cache of the rendered chunks, keyed by (x_chunk, y_chunk): None
+        # for chunks without tiles
+        self.minimap = None
+        self.minimap_revision = None
+        # cached minimap and map revision it was rendered from
+        self.batch_sprites = {}
+        # RLE-accelerated copies of the sprites drawn by `draw_agents`
+
+        self.on_map_change(world.map_data, None)
+        world.add_map_listener(self.on_map_change)
+
+    def on_map_change(self, map_data, tiles):
+        '''Map listener: drops the chunks of the changed tiles, or all of them
+        when a new map is loaded.'''
+        if tiles is None:
+            self.chunks.clear()
+            height, width = np.shape(map_data)
+            self.n_chunks_x = -(-width // self.chunk_size)
+            self.n_chunks_y = -(-height // self.chunk_size)
+
+            # Minimap box sizes, shrunk to fit large maps:
+            scale = min(1., self.size_mini /
+                        (max(width, height) * max(self.box_dx_mini_max,
+                                                  self.box_dy_mini_max)))
+            self.box_dx_mini = self.box_dx_mini_max * scale
+            self.box_dy_mini = self.box_dy_mini_max * scale
+            return
+
+        for x_map, y_map in tiles:
+            self.chunks.pop((x_map // self.chunk_size,
+                             y_map // self.chunk_size), None)
+
+    # Chunks ------------------------------------------------------------------
+
+    def get_chunk_tiles(self, x_chunk, y_chunk):
+        '''Returns the tile ranges (x0, y0, x1, y1) of a chunk (ends
+        excluded).'''
+        height, width = self.world.map_shape
+        x0, y0 = x_chunk * self.chunk_size, y_chunk * self.chunk_size
+
+        return (x0, y0, min(x0 + self.chunk_size, width),
+                min(y0 + self.chunk_size, height))
+
+    def get_chunk_rect(self, x_chunk, y_chunk):
+        '''Returns the area covered by a chunk, as (left, top, width, height)
+        in map pixels.'''
+        stride_dx, stride_dy, unit_dx, unit_dy = self._get_strides()
+        x0, y0, x1, y1 = self.get_chunk_tiles(x_chunk, y_chunk)
+
+        left = (x0 - (y1 - 1)) * stride_dx
+        top = (x0 + y0) * stride_dy
+        # leftmost tile (x0, y1 - 1) and topmost tile (x0, y0)
+        width = ((x1 - 1 - y0) - (x0 - (y1 - 1))) * stride_dx + unit_dx
+        height = ((x1 - 1 + y1 - 1) - (x0 + y0)) * stride_dy + unit_dy
+
+        return left, top, width, height
+
+    def get_chunk(self, x_chunk, y_chunk):
+        '''Returns the surface of a chunk (None if it has no tiles), rendering
+        it if it is not cached.'''
+        key = (x_chunk, y_chunk)
+
+        if key in self.chunks:
+            self.chunks.move_to_end(key)
+        else:
+            self.chunks[key] = self.render_chunk(x_chunk, y_chunk)
+            if len(self.chunks) > self.max_chunks:
+                self.chunks.popitem(last=False)
+                # evicting the least recently used chunk
+
+        return self.chunks[key]
+
+    def render_chunk(self, x_chunk, y_chunk):
+        '''Renders the tiles of a chunk on a new surface, transparent around
+        the tiles.'''
+        x0, y0, x1, y1 = self.get_chunk_tiles(x_chunk, y_chunk)
+        y_tiles, x_tiles = np.nonzero(
+            np.asarray(self.world.map_data)[y0:y1, x0:x1])
+        if len(x_tiles) == 0:
+            return None
+
+        left, top, width, height = self.get_chunk_rect(x_chunk, y_chunk)
+        chunk = pygame.Surface((width, height)).convert()
+        chunk.fill(COLORKEY)
+        chunk.set_colorkey(COLORKEY, pygame.RLEACCEL)
+
+        # Tiles from back to front, so that nearer tiles overlap farther ones:
+        order = np.argsort(x_tiles + y_tiles, kind='stable')
+        sprite = self.world.sprites_maps['grass']
+        chunk.blits([(sprite, coords_map_to_screen(
+                        x0 + x_tiles[i], y0 + y_tiles[i], -left, -top,
+                        self.world.sprites_maps_meta['grass']))
+                     for i in order.tolist()], doreturn=False)
+
+        return chunk
+
+    def get_visible_chunks(self, camera):
+        '''Returns the chunks overlapping the viewport of `camera`, in drawing
+        order (back to front).'''
+        stride_dx, stride_dy, unit_dx, unit_dy = self._get_strides()
+
+        # Visible tiles, in isometric coordinates u = x - y and v = x + y:
+        u_min = (camera.x - unit_dx) / stride_dx
+        u_max = (camera.x + camera.width) / stride_dx
+        v_min = (camera.y - unit_dy) / stride_dy
+        v_max = (camera.y + camera.height) / stride_dy
+
+        # Chunks around the visible tiles:
+        x_chunks = range(max(int((u_min + v_min) / 2) // self.chunk_size, 0),
+                         min(int((u_max + v_max) / 2) // self.chunk_size + 1,
+                             self.n_chunks_x))
+        y_chunks = range(max(int((v_min - u_max) / 2) // self.chunk_size, 0),
+                         min(int((v_max - u_min) / 2) // self.chunk_size + 1,
+                             self.n_chunks_y))
+        # NOTE: The visible tiles form a diamond in map coordinates: the
+        #       chunks of its bounding box are filtered by their own rects.
+
+        chunks = []
+        for y_chunk in y_chunks:
+            for x_chunk in x_chunks:
+                left, top, width, height = self.get_chunk_rect(x_chunk,
+                                                               y_chunk)
+                if (left < camera.x + camera.width and
+                        left + width > camera.x and
+                        top < camera.y + camera.height and
+                        top + height > camera.y):
+                    chunks.append((x_chunk, y_chunk))
+
+        chunks.sort(key=lambda chunk: chunk[0] + chunk[1])
+        # NOTE: Only adjacent chunks overlap, and the one with the larger
+        #       x_chunk + y_chunk is always in front.
+
+        return chunks
+
+    def get_bounds(self):
+        '''Returns the area covered by the whole map, as (left, top, right,
+        bottom) in map pixels.'''
+        stride_dx, stride_dy, unit_dx, unit_dy = self._get_strides()
+        height, width = self.world.map_shape
+
+        return (-(height - 1) * stride_dx, 0,
+                (width - 1) * stride_dx + unit_dx,
+                (width + height - 2) * stride_dy + unit_dy)
+
+    def draw(self, surface, camera):
+        '''Draws the background and the visible chunks of the map on
+        `surface`, the viewport of `camera`.'''
+        surface.fill(self.background)
+
+        offset_x, offset_y = camera.get_offset()
+        blits = []
+        for x_chunk, y_chunk in self.get_visible_chunks(camera):
+            chunk = self.get_chunk(x_chunk, y_chunk)
+            if chunk is not None:
+                left, top, _, _ = self.get_chunk_rect(x_chunk, y_chunk)
+                blits.append((chunk, (left + offset_x, top + offset_y)))
+
+        surface.blits(blits, doreturn=False)
+
+    def draw_agents(self, surface, camera, x_map, y_map, sprite):
+        '''Draws a sprite at each of many positions (e.g. `Agents`), with a
+        single `blits` call, skipping those out of the viewport.
+
+        Sprites are aligned as the player's (see `coords_map_to_screen`), and
+        drawn from back to front.
+        '''
+        stride_dx, stride_dy, unit_dx, _ = self._get_strides()
+        offset_x, offset_y = camera.get_offset()
+        width, height = sprite.get_size()
+
+        if sprite not in self.batch_sprites:
+            self.batch_sprites[sprite] = sprite.copy()
+            self.batch_sprites[sprite].set_colorkey(COLORKEY, pygame.RLEACCEL)
+        # NOTE: Atlas sprites are subsurfaces, which blit about twice slower
+        #       than a standalone run-length encoded copy.
+        sprite = self.batch_sprites[sprite]
+
+        x = (offset_x + unit_dx/2 - width/2) + (x_map - y_map) * stride_dx
+        y = (offset_y - height + stride_dy) + (x_map + y_map) * stride_dy
+        visible = np.flatnonzero((x > -width) & (x < camera.width) &
+                                 (y > -height) & (y < camera.height))
+
+        visible = visible[np.argsort(x_map[visible] + y_map[visible],
+                                     kind='stable')]
+        surface.blits([(sprite, position) for position
+                       in zip(x[visible].tolist(), y[visible].tolist())],
+                      doreturn=False)
+
+    def _get_strides(self):
+        meta = self.world.sprites_maps_meta['grass']
+        return (meta['stride_dx'], meta['stride_dy'],
+                self.world.map_unit_dx, self.world.map_unit_dy)
+
+    # Minimap -----------------------------------------------------------------
+
+    def get_minimap(self):
+        '''Returns the minimap, re-rendering it if the map changed.'''
+        if self.minimap_revision != self.world.map_revision:
+            self.minimap = self.render_minimap()
+            self.minimap_revision = self.world.map_revision
+
+        return self.minimap
+
+    def render_minimap(self):
+        '''Renders a box per tile on a new surface, transparent around the
+        boxes (or a pixel per tile, for large maps).'''
+        map_data = np.asarray(self.world.map_data)
+        height, width = map_data.shape
+        size = (int(np.ceil(width * self.box_dx_mini)),
+                int(np.ceil(height * self.box_dy_mini)))
+
+        if min(self.box_dx_mini, self.box_dy_mini) < 3:
+        # too small for outlines: an opaque pixel per tile, scaled to the
+        # minimap
+            pixels = np.empty((width, height, 3), dtype=np.uint8)
+            pixels[:] = self.background
+            pixels[map_data.T != 0] = 255
+            return pygame.transform.scale(
+                pygame.surfarray.make_surface(pixels), size).convert()
+        else:
+            minimap = pygame.Surface(size).convert()
+            minimap.fill(COLORKEY)
+            for y_map, x_map in zip(*np.nonzero(map_data)):
+                pygame.draw.rect(minimap, (255, 255, 255),\
+                    pygame.Rect(x_map*self.box_dx_mini,
+                                y_map*self.box_dy_mini,\
+                                self.box_dx_mini, self.box_dy_mini), 1)
+                # displaying minimap boxes
+
+        minimap.set_colorkey(COLORKEY)
+
+        return minimap
@@ -0,0 +1,233 @@
+import numpy as np
+
+# src:
+from src.world import World
+from src.player import Player
+from src.agents import Agents, STATUSES
+from src.recorder import NO_ACTION
+from src.utils import check_player_on_tile
+
+class Simulation:
+    '''
+    The logical core of the game: map, player state, on-tile/drop physics and
+    path following.
+
+    It does not need a display, nor it is bound to a frame rate: `step` can be
+    called as fast as the CPU allows (e.g. on render-less training nodes).
+    A step has a fixed duration, and speeds are per step: when rendering, the
+    number of steps per frame is set by a `FixedTimestep` (see
+    `src.timestep`), and the player is drawn at `interpolate`d positions.
+    Rendering is an optional layer on top of it (see `main.Game`), in which
+    case it has to be created with `headless=False`, after the display is set.
+
+    Parameters
+    ----------
+    spawn_x_map, spawn_y_map : float, optional (default: 0, 0)
+        Player spawn position in map coordinates.
+    target : tuple, optional (default: (6, 13))
+        Target tile (x_map, y_map) for path following.
+    method : str, optional (default: 'AStar')
+        Path-finding method, as in `Player.find_path`.
+    headless : bool, optional (default: True)
+        If True, sprites are not loaded.
+    event_log : EventLog, optional (default: None)
+        If given, every step records the player's position, plus the
+        waypoints it heads to and its drops (see `src.log.EventLog`).
+    n_agents : int, optional (default: 0)
+        Size of a crowd of agents (see `Agents`), spawned on random tiles
+        and sent to `target` along with the player.
+    recorder : Recorder, optional (default: None)
+        If given, every step records the state of the player (agent 0) and
+        of the agents (see `src.recorder.Recorder`), one episode file per
+        episode, i.e. between resets.
+    policy : BatchedPolicy, optional (default: None)
+        If given, it drives the agents towards `target` (see
+        `src.policy.BatchedPolicy`), with one model call per step, instead
+        of the paths of `start_moving`.
+    '''
+    def __init__(self, spawn_x_map=0, spawn_y_map=0, target=(6, 13),
+                 method='AStar', headless=True, event_log=None, n_agents=0,
+                 recorder=None, policy=None):
+        self.headless = headless
+        self.event_log = event_log
+        self.recorder = recorder
+        self.policy = policy
+        self._waypoint_logged = None
+        # last waypoint recorded to the event log
+        self.target = target
+        self.method = method
+        self.spawn_x_map = spawn_x_map
+        self.spawn_y_map = spawn_y_map
+
+        # World creation:
+        self.world = World(self, headless=headless)
+        if method == 'HPA':
+            self.world.get_hpa_planner()
+            # built now, rather than in the first step
+
+        # Player control object:
+        self.player = Player(self, spawn_x_map=spawn_x_map,
+                             spawn_y_map=spawn_y_map, headless=headless)
+
+        self.agents = None
+        if n_agents > 0:
+            self.agents = Agents(self.world, n_agents)
+            self.agents.spawn_random()
+
+        self.tick = 0
+        # number of steps performed since the last reset
+        self.player_previous = (spawn_x_map, spawn_y_map, 0)
+        # player's position before the last step, for interpolation
+        self._path_revision = None
+        # map revision the player's waypoints were planned on
+
+    def reset(self, path_to_map=None):
+        '''Puts the player back to spawn, optionally loading a new map.'''
+        if self.recorder is not None:
+            self.recorder.end_episode()
+            # the next step begins a new episode
+
+        if path_to_map is not None:
+            self.world.load_map(path_to_map)
+
+        self.player.x_map = self.spawn_x_map
+        self.player.y_map = self.spawn_y_map
+        self.player.z_map = 0
+        self.player.on_tile = None
+        self.player.status = 'idle'
+        self.player.waypoints = None
+        self.player_previous = (self.spawn_x_map, self.spawn_y_map, 0)
+        if self.agents is not None:
+            self.agents.spawn_random()
+        self.tick = 0
+
+    def start_moving(self):
+        '''Starts following the path to `target` (as the `RETURN` key does).'''
+        self.player.status = 'moving_through'
+        if self.agents is not None and self.policy is None:
+            self.agents.send_to(self.target)
+
+    def step(self, action=None, events=(), keys=None):
+        '''Advances the simulation by one step.
+
+        Parameters
+        ----------
+        action : int, optional (default: None)
+            Index of a movement in `player.ACTIONS`, applied before the
+            physics update. If None, the player is not moved.
+        events : list, optional (default: ())
+            List of events as returned by pygame.event.get(), if any.
+        keys : sequence, optional (default: None)
+            State of the keyboard, as returned by pygame.key.get_pressed(),
+            moving the player with the arrow keys (see `Player.move`).
+
+        Returns
+        -------
+        on_tile : bool
+            Whether the player is on a tile after the step.
+        '''
+        self.player_previous = (self.player.x_map, self.player.y_map,
+                                self.player.z_map)
+
+        if action is not None:
+            self.player.move_action(action)
+        if keys is not None:
+            self.player.move(keys)
+
+        # Checking if the player has to be moved through waypoints:
+        if check_player_on_tile(self.player, self.world):
+        # skipping if player is free falling
+            if self.method == 'DStarLite':
+                self.player.move_through(
+                    events, planner=self.player.get_planner(self.target))
+                # the planner repairs the path at every step
+            else:
+                if self._path_revision != self.world.map_revision:
+                    self.player.waypoints = None
+                    self._path_revision = self.world.map_revision
+                    # the map changed: the path gets planned again
+
+                if self.player.waypoints:
+                    self.player.move_through(events)
+                elif self.player.status == 'moving_through':
+                    self.player.waypoints = None
+                    waypoints = self.player.find_path(*self.target,
+                                    map_data=self.world.map_data,
+                                    method=self.method)
+                    if waypoints:
+                        self.player.move_through(events, waypoints)
+                    elif waypoints is not None:
+                        self.player.status = 'idle'
+                        # already on the target
+                    # None: empty or unreachable target (the player is
+                    # then set idle)
+                # NOTE: The path is only searched when the player starts
+                #       moving, or after a map change, not at every step.
+
+        # Checking if the player is currently over a hole:
+        on_tile_before = self.player.on_tile
+        self.player.on_tile = check_player_on_tile(self.player, self.world)
+        self.player.drop(self.player.on_tile)
+
+        agent_actions = NO_ACTION
+        if self.agents is not None:
+            if self.policy is not None:
+                agent_actions = self.policy.act(
+                    self.agents, self.target,
+                    key=(self.world.map_revision, self.tick))
+            self.agents.step(None if self.policy is None else agent_actions)
+
+        if self.event_log is not None:
+            self._record_events(on_tile_before)
+        if self.recorder is not None:
+            self._record_state(action, agent_actions)
+
+        self.tick += 1
+
+        if self.policy is not None and self.agents is not None:
+            self.policy.prefetch(self.agents, self.target,
+                                 key=(self.world.map_revision, self.tick))
+            # inferring the next step's actions while the caller goes on
+
+        return self.player.on_tile
+
+    def interpolate(self, alpha):
+        '''Returns the player's position (x_map, y_map, z_map) at a fraction
+        `alpha` of the last step, between its position before and after it.'''
+        player = self.player
+        x_map, y_map, z_map = self.player_previous
+
+        return (x_map + alpha * (player.x_map - x_map),
+                y_map + alpha * (player.y_map - y_map),
+                z_map + alpha * (player.z_map - z_map))
+
+    def _record_state(self, action, agent_actions=NO_ACTION):
+        '''Records the state of the player and of the agents after the last
+        step.'''
+        recorder = self.recorder
+        if recorder.file is None:
+            recorder.begin_episode()
+        map_id = recorder.get_map_id(self.world)
+
+        player = self.player
+        recorder.record(self.tick, 0, player.x_map, player.y_map,
+                        player.z_map, STATUSES.index(player.status),
+                        NO_ACTION if action is None else action, map_id)
+
+        if self.agents is not None:
+            agents = self.agents
+            recorder.record(self.tick, np.arange(1, agents.n_agents + 1),
+                            agents.x_map, agents.y_map, agents.z_map,
+                            agents.status, agent_actions, map_id)
+
+    def _record_events(self, on_tile_before):
+        '''Records the events of the last step to the event log.'''
+        player = self.player
+        if player.waypoints and player.waypoints[0] != self._waypoint_logged:
+            self._waypoint_logged = list(player.waypoints[0])
+            self.event_log.record(self.tick, 'waypoint', *player.waypoints[0])
+        if on_tile_before is not False and not player.on_tile:
+            self.event_log.record(self.tick, 'drop', player.x_map,
+                                  player.y_map, player.z_map)
+        self.event_log.record(self.tick, 'step', player.x_map, player.y_map,
+                              player.z_map)
@@ -0,0 +1,76 @@
+'''
+Fixed-timestep scheduling of the simulation, decoupled from the render rate.
+
+The simulation advances by steps of a fixed duration `dt` (speeds are per
+step), whatever the frame rate: the wall time of each frame, scaled by the
+time scale, goes into an accumulator, from which whole steps are taken. A
+frame can then run any number of steps (none, at a low time scale), and
+rendering interpolates between the last two steps, by the fraction of a step
+left in the accumulator:
+
+    n_steps = timestep.advance(frame_time)
+    for _ in range(n_steps):
+        sim.step()
+    draw(sim.interpolate(timestep.alpha))
+'''
+import math
+
+TICK_RATE = 60
+# simulation steps per second of simulated time
+
+
+class FixedTimestep:
+    '''
+    Accumulator turning frame times into a number of simulation steps.
+
+    Parameters
+    ----------
+    dt : float, optional (default: 1/60)
+        Duration of a step, in seconds of simulated time.
+    time_scale : float, optional (default: 1)
+        Simulated seconds per second of wall time (e.g. 10 = 10x real time).
+    max_steps : int, optional (default: 256)
+        Steps run by a frame at most. When frames cannot keep up (e.g. after
+        a stall), the excess time is dropped rather than carried over, so
+        that the backlog does not keep growing.
+    '''
+    def __init__(self, dt=1/TICK_RATE, time_scale=1., max_steps=256):
+        self.dt = dt
+        self.time_scale = time_scale
+        self.max_steps = max_steps
+
+        self.accumulator = 0.
+        # simulated time not yet stepped through, in seconds
+        self.n_steps = 0
+        # steps run so far
+        self.time_dropped = 0.
+        # simulated time dropped by frames over `max_steps`, in seconds
+
+    def advance(self, frame_time):
+        '''Adds the wall time of a frame, in seconds, and returns the number
+        of steps to be run.'''
+        self.accumulator += frame_time * self.time_scale
+        n_steps = int(self.accumulator / self.dt)
+
+        if n_steps > self.max_steps:
+            self.time_dropped += (n_steps - self.max_steps) * self.dt
+            n_steps = self.max_steps
+
+        self.accumulator = math.fmod(self.accumulator, self.dt)
+        # NOTE: The fraction of a step left is kept in any case: `alpha`
+        #       stays continuous from frame to frame.
+        self.n_steps += n_steps
+
+        return n_steps
+
+    @property
+    def alpha(self):
+        '''Fraction of a step elapsed since the last step, in [0, 1), to
+        interpolate the rendered state between the last two steps.'''
+        return self.accumulator / self.dt
+
+    def scale(self, factor, low=1/8, high=128.):
+        '''Multiplies the time scale by `factor`, within [low, high].'''
+        self.time_scale = min(max(self.time_scale * factor, low), high)
+
+        return self.time_scale
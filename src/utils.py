@@ -1,4 +1,5 @@
-import pygame
+import math
+import numpy as np
 
 def coords_map_to_screen(x_map, y_map, offset_x, offset_y, sprites_maps_meta,
                          type='tile', world=None, player=None):
@@ -56,27 +57,23 @@ def coords_map_to_mini(x_map, y_map, box_dx_mini, box_dy_mini):
     return x_mini, y_mini
 
 def check_player_on_tile(player, world):
-    '''Checks if player is on a tile (any tile).'''
+    '''Checks if player is on a tile (any tile).
+
+    The tile under the player is found by rounding its position, and looked up
+    directly in the map.
+    '''
 
     if player.z_map < 0: return False
     # player is already free-falling
 
-    player_on_tile = False
-
-    # Iterating over tiles, checking there is one under the player:
-    for y_map, x_map in world.coordinates:
-        
-        if world.map_data[y_map][x_map]:
-        # there is a "1" in the map
-
-            #print('........', x_map, y_map)
-            #print('........', player.x_map, player.y_map)
+    # NOTE: Tile e.g. (0, 0) ranges between -0.5 and 0.5 in both axes
+    x_map = math.floor(player.x_map + 0.5)
+    y_map = math.floor(player.y_map + 0.5)
 
-            # NOTE: Tile e.g. (0, 0) ranges between -0.5 and 0.5 in both axes 
-            if x_map - 0.5 <= player.x_map < x_map + 0.5 and\
-               y_map - 0.5 <= player.y_map < y_map + 0.5:
-            # A tile has been found under the player! -- interrupting search
-                player_on_tile = True
+    height, width = world.map_shape
+    player_on_tile = 0 <= x_map < width and 0 <= y_map < height and\
+                     bool(world.map_data[y_map][x_map])
+    # there is a "1" in the map, under the player
     
     if not player_on_tile:
         player.z_map = -999
@@ -87,6 +84,77 @@ def check_player_on_tile(player, world):
 
     return player_on_tile
 
+def check_on_tile_batch(x_map, y_map, map_data, z_map=None):
+    '''Checks if each of many agents is on a tile (any tile).
+
+    Unlike `check_player_on_tile`, the agents' state is not modified.
+
+    Parameters
+    ----------
+    x_map, y_map : array-like, shape (n_agents,)
+        Positions in map coordinates.
+    map_data : np.ndarray, shape (height, width) or (n_agents, height, width)
+        Map data in numerical form (0 = no tile), either shared by all the
+        agents or one per agent.
+    z_map : array-like, shape (n_agents,), optional (default: None)
+        Heights in map coordinates: agents below 0 are free-falling, hence
+        never on a tile.
+
+    Returns
+    -------
+    on_tile : np.ndarray, shape (n_agents,), dtype: bool
+    '''
+    map_data = np.asarray(map_data)
+    height, width = map_data.shape[-2:]
+
+    # NOTE: Tile e.g. (0, 0) ranges between -0.5 and 0.5 in both axes
+    x_tile = np.floor(np.asarray(x_map) + 0.5).astype(np.int64)
+    y_tile = np.floor(np.asarray(y_map) + 0.5).astype(np.int64)
+    inside = (0 <= x_tile) & (x_tile < width) & (0 <= y_tile) & (y_tile < height)
+
+    # Clipping out-of-map positions, which are masked afterwards anyway:
+    x_tile = np.clip(x_tile, 0, width - 1)
+    y_tile = np.clip(y_tile, 0, height - 1)
+
+    if map_data.ndim == 2:
+        on_tile = map_data[y_tile, x_tile] != 0
+    else:
+        on_tile = map_data[np.arange(len(x_tile)), y_tile, x_tile] != 0
+    on_tile &= inside
+
+    if z_map is not None:
+        on_tile &= np.asarray(z_map) >= 0
+
+    return on_tile
+
+def read_meta_csv(path_to_meta):
+    '''Reads a sprite meta file: a small CSV file with a header line, where
+    lines starting with '#' are comments.
+
+    Returns
+    -------
+    rows : list of dict
+        One {column: value} dict per row, with values converted to int (or
+        float) where possible.
+    '''
+    def convert(value):
+        for type_ in (int, float):
+            try:
+                return type_(value)
+            except ValueError:
+                pass
+        return value
+
+    with open(path_to_meta) as file:
+        lines = [line.strip() for line in file]
+    lines = [line for line in lines if line and not line.startswith('#')]
+
+    columns = [column.strip() for column in lines[0].split(',')]
+
+    return [dict(zip(columns, (convert(value.strip())
+                               for value in line.split(','))))
+            for line in lines[1:]]
+
 """
 def coords_screen_to_map(x, y, offset_x, offset_y, sprite_stride_dx, sprite_stride_dy):    
 
@@ -128,4 +196,4 @@ def coords_map_to_screen_player(x_map, y_map, offset_x, offset_y,
     y = y + player_offset_y
 
     return x, y
-"""
\ No newline at end of file
+"""
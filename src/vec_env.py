@@ -0,0 +1,165 @@
+import numpy as np
+
+# src:
+from src.map_generators import create_traversable_map
+from src.player import ACTIONS
+from src.utils import check_on_tile_batch
+
+class VecWalkerEnv:
+    '''
+    Gym-style vector environment, running N worlds in lockstep.
+
+    Maps and player states of all the worlds are stacked into NumPy arrays,
+    and `step` applies the `Player.move_action`, on-tile check and
+    `Player.drop` physics to all of them at once. Each world holds a freshly
+    generated traversable map, in which the player spawns at the left end of
+    the guaranteed path and has to reach its right end. Finished episodes are
+    automatically reset with new maps.
+
+    Parameters
+    ----------
+    n_envs : int
+        Number of worlds.
+    width, height : int, optional (default: 15, 15)
+        Map size in tiles.
+    p_tile : float, optional (default: 0.5)
+        Tile probability, as in `create_traversable_map`.
+    max_steps : int, optional (default: 500)
+        Steps after which an episode is truncated.
+    speed : float, optional (default: 0.1)
+        Player speed, as in `Player.move_action`.
+    drop_speed : float, optional (default: 0.5)
+        Player speed when falling, as in `Player.drop`.
+    reward_goal, reward_fall, reward_step : float, optional
+        Rewards for reaching the goal, for falling off the map, and for every
+        step taken.
+    seed : int, optional (default: None)
+        Seed of the map generator.
+    '''
+    def __init__(self, n_envs, width=15, height=15, p_tile=0.5, max_steps=500,
+                 speed=0.1, drop_speed=0.5,
+                 reward_goal=1., reward_fall=-1., reward_step=-0.01, seed=None):
+        self.n_envs = n_envs
+        self.rng = np.random.default_rng(seed)
+        self.width = width
+        self.height = height
+        self.p_tile = p_tile
+        self.max_steps = max_steps
+        self.speed = speed
+        self.drop_speed = drop_speed
+        self.reward_goal = reward_goal
+        self.reward_fall = reward_fall
+        self.reward_step = reward_step
+
+        self.n_actions = len(ACTIONS)
+        self.actions = np.array(ACTIONS, dtype=np.float64)
+        # displacement of each action, indexed by action
+
+        # Stacked states:
+        self.maps = np.zeros((n_envs, height, width), dtype=np.uint8)
+        self.x_map = np.zeros(n_envs)
+        self.y_map = np.zeros(n_envs)
+        self.z_map = np.zeros(n_envs)
+        self.goals = np.zeros((n_envs, 2), dtype=np.int64)
+        # goal tiles, as [x_map, y_map]
+        self.steps = np.zeros(n_envs, dtype=np.int64)
+        # steps since last reset
+
+    def _reset_envs(self, envs):
+        '''Generates new maps and respawns the players of the given worlds.'''
+        maps, waypoints = create_traversable_map(
+            self.height, self.width, p_tile=self.p_tile, return_waypoints=True,
+            rng=self.rng, n_maps=len(envs))
+        self.maps[envs] = maps
+
+        # Spawn and goal at the ends of the guaranteed path:
+        self.x_map[envs] = waypoints[:, 0, 1]
+        self.y_map[envs] = waypoints[:, 0, 0]
+        self.goals[envs] = waypoints[:, -1, ::-1]
+        # NOTE: Waypoints are [row, col], i.e. [y_map, x_map].
+
+        self.z_map[envs] = 0
+        self.steps[envs] = 0
+
+    def _observe(self):
+        '''Returns the batched observations.'''
+        return {
+            'map': self.maps.copy(),
+            'position': np.stack((self.x_map, self.y_map), axis=1),
+            'goal': self.goals.copy(),
+        }
+
+    def reset(self):
+        '''Resets all the worlds.
+
+        Returns
+        -------
+        obs : dict
+            Batched observations: 'map' (N, height, width), 'position'
+            (N, 2) as [x_map, y_map], 'goal' (N, 2) as [x_map, y_map].
+        '''
+        self._reset_envs(np.arange(self.n_envs))
+
+        return self._observe()
+
+    def step(self, actions):
+        '''Advances all the worlds by one step.
+
+        Parameters
+        ----------
+        actions : array-like, shape (N,), dtype: int
+            Index of a movement in `player.ACTIONS`, for each world.
+
+        Returns
+        -------
+        obs : dict
+            Batched observations, as in `reset`. Finished worlds are already
+            reset.
+        rewards : np.ndarray, shape (N,)
+        dones : np.ndarray, shape (N,), dtype: bool
+        infos : dict
+            'reached_goal', 'fell' and 'truncated' flags, and the
+            'final_position' of the players before the automatic reset.
+        '''
+        actions = np.asarray(actions, dtype=np.int64)
+
+        # Moving players:
+        displacement = self.actions[actions] * self.speed
+        self.x_map += displacement[:, 0]
+        self.y_map += displacement[:, 1]
+
+        # Checking if players are over a hole (and dropping them):
+        on_tile = check_on_tile_batch(self.x_map, self.y_map, self.maps,
+                                      z_map=self.z_map)
+        self.z_map[~on_tile] = -999
+        # setting player to free-fall
+        self.x_map[~on_tile] += self.drop_speed
+        self.y_map[~on_tile] += self.drop_speed
+
+        self.steps += 1
+
+        # Outcomes:
+        x_tile = np.floor(self.x_map + 0.5)
+        y_tile = np.floor(self.y_map + 0.5)
+        reached_goal = on_tile &\
+            (x_tile == self.goals[:, 0]) & (y_tile == self.goals[:, 1])
+        fell = ~on_tile
+        truncated = ~reached_goal & ~fell & (self.steps >= self.max_steps)
+        dones = reached_goal | fell | truncated
+
+        rewards = np.full(self.n_envs, self.reward_step)
+        rewards[reached_goal] += self.reward_goal
+        rewards[fell] += self.reward_fall
+
+        infos = {
+            'reached_goal': reached_goal,
+            'fell': fell,
+            'truncated': truncated,
+            'final_position': np.stack((self.x_map, self.y_map), axis=1),
+        }
+
+        # Auto-reset of finished episodes:
+        if dones.any():
+            self._reset_envs(np.flatnonzero(dones))
+
+        return self._observe(), rewards, dones, infos
@@ -1,37 +1,70 @@
-import pygame
-
 import numpy as np
-import glob
-import pandas as pd
 import os
+from collections import OrderedDict
 
 # src:
 from src.map_generators import create_simple_map, create_traversable_map,\
-                               write_map_to_file
+                               write_map_to_file, read_map_file
+from src.flow_field import compute_flow_field
+from src.hpa import HierarchicalPlanner
+from src.reachability import label_components, is_reachable
+from src.log import get_logger
+
+log = get_logger('world')
 
 class World:
     '''
     The world class, where everything visible in the view belongs.
     '''
-    def __init__(self, main):
+    def __init__(self, main, flow_field_cache_size=16, headless=False,
+                 seed=None):
         self.main = main
+
+        self.rng = np.random.default_rng(seed)
+        # random generator used by the map generators
+
+        self.map_revision = 0
+        # counter bumped every time the map changes, used to invalidate caches
+        # derived from the map (e.g. paths)
+        self._map_astar = None
+        self._map_astar_revision = None
+        # map in the form expected by `astar`, and its revision
+        self._map_labels = None
+        self._map_labels_revision = None
+        # connected components of the map, and their revision
+        self.flow_fields = OrderedDict()
+        self.flow_field_cache_size = flow_field_cache_size
+        # LRU cache of flow fields, keyed by (map revision, goal)
+        self.hpa_planner = None
+        # hierarchical planner, built on first use and then rebuilt with
+        # every new map (see `get_hpa_planner`)
+        self.map_listeners = []
+        # callbacks notified of map changes (see `add_map_listener`)
         
         self.path_tmp = 'data/tmp'
         if not os.path.exists(self.path_tmp): os.makedirs(self.path_tmp) 
 
         self.load_map('data/maps/map_test.txt')
-        self.load_sprites_maps('data/images/sprites/maps')
 
-        # Capturing tile unit sizes from first the sprite loaded:
-        self.map_unit_dx, self.map_unit_dy = \
-            list(self.sprites_maps.values())[0].get_size()
-        # tile unit sizes in screen pixels
+        self.map_unit_dx, self.map_unit_dy = None, None
+        # tile unit sizes in screen pixels (unknown without sprites)
+        if not headless:
+        # sprites need a display, hence they are skipped in headless mode
+            self.load_sprites_maps('data/images/sprites/maps')
+
+            # Capturing tile unit sizes from first the sprite loaded:
+            self.map_unit_dx, self.map_unit_dy = \
+                list(self.sprites_maps.values())[0].get_size()
 
-    def load_map(self, path_to_map):
-        f = open(path_to_map)
-        self.map_data = [[int(c) for c in row] for row in f.read().split('\n')]
-        self.map_data = np.array(self.map_data)
-        f.close()
+    def load_map(self, path_to_map, index=0):
+        '''Loads a map file ('.npz' or '.txt', see `read_map_file`), or map
+        `index` of a '.npz' shard holding a stack of maps.'''
+        self.set_map(read_map_file(path_to_map, index=index))
+
+    def set_map(self, map_data):
+        '''Replaces the current map with `map_data` (0 = no tile), indexed as
+        [y_map][x_map].'''
+        self.map_data = map_data
 
         # Create the coordinate grid using meshgrid:
         y_map, x_map = np.indices(self.map_data.shape)
@@ -42,28 +75,124 @@ class World:
         # Map size:
         self.map_shape = self.map_data.shape
 
-    def load_sprites_maps(self, path_sprites_maps):
-        self.sprites_maps = {}
-        self.sprites_maps_meta = {}
-        
-        for filename in glob.glob(path_sprites_maps + '/*.png'):
-            sprite = pygame.image.load(filename).convert()
-            sprite.set_colorkey((0, 0, 0))
+        self.map_revision += 1
+        if self.hpa_planner is not None:
+            self.hpa_planner.build(self.map_data)
+            # rebuilt along with the map, rather than in the first search on
+            # it (i.e. in the middle of a step)
+
+        for listener in self.map_listeners:
+            listener(self.map_data, None)
+
+    def set_tiles(self, tiles, value):
+        '''Sets some tiles of the current map, e.g. to open or close holes.
+
+        Parameters
+        ----------
+        tiles : list
+            Tiles to be changed, as [x_map, y_map].
+        value : int
+            New tile value (0 = no tile).
+        '''
+        for x_map, y_map in tiles:
+            self.map_data[y_map][x_map] = value
+
+        self.map_revision += 1
+        if self.hpa_planner is not None:
+            self.hpa_planner.update(self.map_data, tiles)
+            # only the clusters around the changed tiles get rebuilt
+
+        for listener in self.map_listeners:
+            listener(self.map_data, tiles)
+
+    def add_map_listener(self, listener):
+        '''Registers a callback, called as `listener(map_data, tiles)` every
+        time the map changes: `tiles` lists the changed tiles as
+        [x_map, y_map], or is None when a whole new map is loaded.
 
-            sprite_name = filename.split('/')[-1].split('.')[0]
-            self.sprites_maps[sprite_name] = sprite
+        Meant for persistent structures derived from the map, which can be
+        repaired rather than rebuilt (e.g. `DStarLite`).
+        '''
+        self.map_listeners.append(listener)
+
+    def remove_map_listener(self, listener):
+        '''Unregisters a callback added with `add_map_listener`.'''
+        self.map_listeners.remove(listener)
+
+    def get_map_astar(self):
+        '''Returns the current map in the form expected by `astar`, i.e.
+        indexed as [x_map][y_map] and with 0 for walkable tiles.
+
+        The conversion is performed once per map revision.
+        '''
+        if self._map_astar_revision != self.map_revision:
+            # Inverting map values, to conform AStar's expected input:
+            self._map_astar = 1 - np.array(self.map_data, dtype=np.uint8).T
+            # map's x and y get switched in numpy, hence the transpose
+            self._map_astar_revision = self.map_revision
+
+        return self._map_astar
+
+    def get_map_labels(self):
+        '''Returns the connected components of the current map (see
+        `label_components`), labeled once per map revision.
+        '''
+        if self._map_labels_revision != self.map_revision:
+            self._map_labels = label_components(self.map_data)
+            self._map_labels_revision = self.map_revision
 
-            filename_meta = filename.strip('png') + 'meta.csv'
-            # name of file containing meta info related to map sprite
+        return self._map_labels
 
-            df_meta = pd.read_csv(filename_meta, comment='#')
+    def is_reachable(self, start, goal):
+        '''True if tile `goal` can be reached from tile `start` (both as
+        (x_map, y_map)) on the current map, in O(1) once the map is
+        labeled.
+        '''
+        return is_reachable(self.get_map_labels(), start, goal)
 
-            self.sprites_maps_meta[sprite_name] = {
-                'stride_dx': df_meta['stride_dx'].values[0],
-                'stride_dy': df_meta['stride_dy'].values[0],
-            }
+    def get_flow_field(self, goal):
+        '''Returns the flow field towards `goal` (x_map, y_map) on the current
+        map, computing it only once per map revision.
+        '''
+        key = (self.map_revision, tuple(goal))
+
+        if key in self.flow_fields:
+            self.flow_fields.move_to_end(key)
+        else:
+            self.flow_fields[key] = compute_flow_field(self.map_data, goal)
+            if len(self.flow_fields) > self.flow_field_cache_size:
+                self.flow_fields.popitem(last=False)
+                # evicting the least recently used field
+
+        return self.flow_fields[key]
+
+    def get_hpa_planner(self):
+        '''Returns the hierarchical planner of the current map, building it
+        on first use (see `HierarchicalPlanner`). From then on, it is rebuilt
+        by `set_map` and updated by `set_tiles`.
+
+        A build takes ~1.5 s on a 512x512 map, and ~7 s on a 1024x1024 map:
+        the first call is meant to happen at load time (as `Simulation` does
+        for method 'HPA'), not within a step.
+        '''
+        if self.hpa_planner is None:
+            self.hpa_planner = HierarchicalPlanner(self.map_data)
 
-    def generate_map(self, width, height, type='simple', load=True):
+        return self.hpa_planner
+
+    def load_sprites_maps(self, path_sprites_maps):
+        from src.assets import get_atlas
+        # NOTE: pygame (used by the atlas) is only imported where it is
+        #       needed, so that headless processes (e.g. rollout workers) do
+        #       not pay for it at startup.
+
+        # Sprites and their meta info, from the shared sprite atlas:
+        atlas = get_atlas(os.path.dirname(path_sprites_maps))
+        folder = os.path.basename(path_sprites_maps)
+        self.sprites_maps = atlas.get_group(folder)
+        self.sprites_maps_meta = atlas.get_group_meta(folder)
+
+    def generate_map(self, width, height, type='simple', load=True, rng=None):
         '''
         Invokes a map generator and stores the map in the relevant folder.
         
@@ -79,23 +208,30 @@ class World:
             - 'traversable': `create_traversable_map`
         load : bool (default: True)
             If True, loads the generated map and replaces the existing one.
+        rng : np.random.Generator or int, optional (default: None)
+            Random generator, or seed. If None, the world's generator is used.
         '''
         
         self.path_tmp_maps = self.path_tmp + '/maps'
         if not os.path.exists(self.path_tmp_maps):
-            print('generate_map:: %s created' % self.path_tmp_maps)
+            log.info('generate_map:: %s created', self.path_tmp_maps)
             os.makedirs(self.path_tmp_maps) 
 
+        if rng is None: rng = self.rng
+        seed = int(np.random.default_rng(rng).integers(2**63))
+        # per-map seed, stored with the map to regenerate it
+
         if type == 'simple':
-            map_data = create_simple_map(width, height, p_hole=0.5)
+            map_data = create_simple_map(width, height, p_hole=0.5, rng=seed)
         if type == 'traversable':
-            map_data = create_traversable_map(width, height, p_tile=0.5)
+            map_data = create_traversable_map(width, height, p_tile=0.5,
+                                              rng=seed)
 
         # Write map to file:
-        path_to_basename = self.path_tmp_maps+'/map.txt'
+        path_to_basename = self.path_tmp_maps+'/map.npz'
         # path to basename file: it will be renamed with sequential integers
-        # (i.e., ..._0.txt, ..._1.txt, etc.), according to the already existing
-        # maps in the target folder.
-        path_to_map = write_map_to_file(map_data, path_to_basename)
+        # (i.e., ..._0.npz, ..._1.npz, etc.), according to the maps already
+        # written in the target folder.
+        path_to_map = write_map_to_file(map_data, path_to_basename, seed=seed)
 
         if load: self.load_map(path_to_map)
\ No newline at end of file
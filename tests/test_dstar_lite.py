@@ -0,0 +1,38 @@
+import numpy as np
+
+# src:
+from src.astar import astar
+from src.dstar_lite import DStarLite
+
+
+def test_goal_toggled_into_a_hole_and_back():
+    map_data = np.ones((10, 10), dtype=np.uint8)
+    goal = (7, 7)
+    planner = DStarLite(map_data, goal)
+    planner.update_start((1, 1))
+    assert planner.extract_path()[-1] == goal
+
+    map_data[goal[1], goal[0]] = 0
+    planner.on_map_change(map_data, [list(goal)])
+    assert planner.extract_path() is None
+
+    planner.update_start((2, 1))
+    assert planner.extract_path() is None
+    planner.update_start(goal)
+    assert planner.extract_path() is None
+    # e.g. the tile under the player turning into a hole
+    planner.update_start((2, 1))
+
+    map_data[goal[1], goal[0]] = 1
+    planner.on_map_change(map_data, [list(goal)])
+    path = planner.extract_path()
+    assert path[0] == (2, 1) and path[-1] == goal
+    assert len(path) == len(astar(1 - map_data.T, (2, 1), goal))
+
+
+def test_goal_in_a_hole_from_the_start():
+    map_data = np.ones((10, 10), dtype=np.uint8)
+    map_data[7, 7] = 0
+    planner = DStarLite(map_data, (7, 7))
+    planner.update_start((1, 1))
+    assert planner.extract_path() is None
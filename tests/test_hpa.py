@@ -0,0 +1,58 @@
+import numpy as np
+
+# src:
+from src.astar import astar
+from src.hpa import HierarchicalPlanner
+
+
+def path_cost(path):
+    return sum(2 ** 0.5 if x0 != x1 and y0 != y1 else 1.
+               for (x0, y0), (x1, y1) in zip(path[:-1], path[1:]))
+
+
+def test_start_in_hole_next_to_another_cluster():
+    map_data = np.zeros((20, 40), dtype=np.uint8)
+    map_data[:, 16:] = 1
+    # the start (15, 5) is a hole of cluster (0, 0), next to cluster (0, 1)
+
+    path = HierarchicalPlanner(map_data).find_path((15, 5), (30, 5))
+
+    assert path == [(x_map, 5) for x_map in range(15, 31)]
+
+
+def test_same_cluster_path_leaving_the_cluster():
+    map_data = np.ones((16, 32), dtype=np.uint8)
+    map_data[7, 1:16] = 0
+    # start and goal share cluster (0, 0), but the shortest path between
+    # them goes around the wall through cluster (0, 1), not through the gap
+    # at x_map = 0
+    start, goal = (15, 2), (15, 13)
+
+    path = HierarchicalPlanner(map_data).find_path(start, goal)
+    expected = astar(1 - map_data.T, start, goal)
+
+    assert path[0] == start and path[-1] == goal
+    assert any(x_map >= 16 for x_map, _ in path)
+    assert path_cost(path) <= 1.2 * path_cost(expected)
+    # NOTE: Up to the crossings, restricted to entrances.
+
+
+def test_reachability_as_astar_on_random_maps():
+    rng = np.random.default_rng(0)
+    for _ in range(5):
+        map_data = (rng.random((40, 40)) < 0.6).astype(np.uint8)
+        planner = HierarchicalPlanner(map_data, cluster_size=8)
+        for _ in range(40):
+            start = tuple(int(i) for i in rng.integers(40, size=2))
+            goal = tuple(int(i) for i in rng.integers(40, size=2))
+            if not map_data[goal[1], goal[0]]:
+                continue
+
+            path = planner.find_path(start, goal)
+            expected = astar(1 - map_data.T, start, goal)
+
+            assert (path is None) == (expected is None)
+            if path is not None:
+                assert path[0] == start and path[-1] == goal
+                assert all(map_data[y_map, x_map] for x_map, y_map in path[1:])
+                assert path_cost(path) >= path_cost(expected) - 1e-9